@@ -1,28 +1,44 @@
 # benchmarking.py
 
 import argparse
-import csv
+import contextlib
+import io
 import json
 import math
+import multiprocessing
 import os
 import subprocess
 import sys
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 
-
-from util import read_instance
+from graph import Graph
+from heuristic import DEFAULT_ROOTS
+from kmst import BENCHMARK_FORMULATIONS, FORMULATIONS, RACE_FORMULATIONS, build_parser, solve
+from profiling import Profile
+from resultstore import ResultStore
+from util import init_worker, read_instance_arrays, worker_env
 
 
 
 DATA_DIR_DEFAULT = "mathprog-programming/data"
 OUTPUT_CSV_DEFAULT = "benchmark_results.csv"
-# List of formulation identifiers expected by kmst.py
-FORMULATIONS = ["seq", "scf", "mcf", "cec", "dcc"]
+RESULTS_STORE_DEFAULT = "benchmark_results.jsonl"
+# race runs the --race-formulations of kmst.py in parallel, it is only benchmarked if asked for
+RACE = "race"
 #benchmark params
 THREADS = 1
 TIMELIMIT = 3600 # seconds (1 hour)
 MEMORYLIMIT = 8  # GB
+# preprocessing of kmst.py, which is off by default there
+HEURISTIC_ROOTS = DEFAULT_ROOTS
+REDUCTION = True
+LAGRANGIAN = True
+# in-process runner: worker processes are replaced after this many jobs
+JOBS_PER_WORKER = 20
 # Temporary file for passing results from subprocess
 #TEMP_RESULT_FILENAME = "_temp_bench_result.json"
 
@@ -41,18 +57,63 @@ def calculate_k_values(num_nodes):
     # Let's keep it for now as it's technically in the range.
     return k_values
 
-def run_single_experiment(instance_path, k_value, formulation, temp_result_path):
+def total_memory_gb():
+    """Physical memory of the machine in GB (falls back to MEMORYLIMIT if it cannot be determined)."""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 2**30
+    except (AttributeError, ValueError, OSError):
+        return MEMORYLIMIT
+
+def estimate_job_size(num_nodes, num_edges, k, formulation):
+    """Rough relative effort of a run, used to start the largest jobs first."""
+    size = num_edges * k
+    if formulation == "mcf":
+        size *= num_nodes # one commodity per node
+    return size
+
+def solver_options(args):
+    """kmst.py arguments of the benchmark options that apply to every run (race formulations, decomposition)."""
+    options = ["--race-formulations", *args.race_formulations]
+    if args.decompose:
+        options += ["--decompose", "--workers", str(args.workers)]
+    return options
+
+def processes_per_run(formulation, args):
+    """Solver processes of one run, each uses --threads cores."""
+    if formulation == RACE:
+        return len(set(args.race_formulations))
+    return args.workers if args.decompose else 1
+
+def kmst_arguments(instance_path, k_value, formulation, threads, memorylimit, options=()):
+    """Command line arguments of kmst.py for a benchmark run (the same in both runner modes)."""
+    return [
+        "--instance", str(instance_path),
+        "--k", str(k_value),
+        "--formulation", formulation,
+        "--threads", str(threads),
+        "--timelimit", str(TIMELIMIT),
+        "--memorylimit", str(memorylimit),
+        "--heuristic-roots", str(HEURISTIC_ROOTS),
+        "--reduction" if REDUCTION else "--no-reduction",
+        "--lagrangian" if LAGRANGIAN else "--no-lagrangian",
+        *options,
+    ]
+
+def complete_result(run_data):
+    run_data.setdefault('n_lazy_constraints', 0)#Assumes kmst.py adds 'n_lazy_constraints'
+    for key in ('n_user_cuts', 'n_pool_hits', 'n_pool_misses', 'n_pool_duplicates', 'n_removed_nodes', 'n_removed_edges'):
+        run_data.setdefault(key, 0)
+    run_data.setdefault('is_valid_k_mst', False) #default to false !
+    return run_data
+
+def run_single_experiment(instance_path, k_value, formulation, temp_result_path, threads=THREADS, memorylimit=MEMORYLIMIT,
+                          options=()):
    
    
     command = [
         sys.executable,        # Use the same python interpreter running this script
         "mathprog-programming/src/kmst/kmst.py",             # The script to run
-        "--instance", str(instance_path),
-        "--k", str(k_value),
-        "--formulation", formulation,
-        "--threads", str(THREADS),
-        "--timelimit", str(TIMELIMIT),
-        "--memorylimit", str(MEMORYLIMIT),
+        *kmst_arguments(instance_path, k_value, formulation, threads, memorylimit, options),
         "--results-file", str(temp_result_path)
         # We don't need --solution-file for benchmarking runs
         
@@ -78,8 +139,7 @@ def run_single_experiment(instance_path, k_value, formulation, temp_result_path)
                         run_data = json.load(f)
                     
                     
-                    run_data.setdefault('n_lazy_constraints', 0)#Assumes kmst.py adds 'n_lazy_constraints'
-                    run_data.setdefault('is_valid_k_mst', False) #default to false !
+                    complete_result(run_data)
                     run_successful = True
                 except json.JSONDecodeError:
                     print(f"  ERROR: Failed to decode JSON from temp file: {temp_result_path}")
@@ -117,24 +177,200 @@ def run_single_experiment(instance_path, k_value, formulation, temp_result_path)
 
     return run_data # Returns the dictionary on success, None on failure
 
+# instances parsed by an in-process worker, its Gurobi environment is started by util.init_worker
+_worker_instances = {}
+
+def run_in_process(instance_path, k_value, formulation, threads, memorylimit, options=()):
+    profile = Profile()
+    with profile.phase("read"):
+        graph = _worker_instances.get(instance_path)
+        if graph is None:
+            graph = _worker_instances[instance_path] = Graph.read(str(instance_path))
+
+    args = build_parser().parse_args(kmst_arguments(instance_path, k_value, formulation, threads, memorylimit, options))
+    with contextlib.redirect_stdout(io.StringIO()):
+        return complete_result(solve(graph, args, worker_env(), profile))
+
+class InProcessRunner:
+    """Runs kmst.solve in worker processes that keep their Gurobi environment and parsed instances.
+
+    This avoids starting an interpreter, importing the solver and creating an environment for
+    every run. Workers are replaced after jobs_per_worker jobs, which bounds memory growth over
+    a long sweep. If a worker dies (e.g. killed for running out of memory), the pool is
+    replaced; only the runs that were in the broken pool fail.
+    """
+
+    def __init__(self, max_workers, jobs_per_worker=JOBS_PER_WORKER):
+        self.max_workers = max_workers
+        self.jobs_per_worker = jobs_per_worker
+        self._lock = threading.Lock()
+        self._pool = self._new_pool()
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=init_worker, max_tasks_per_child=self.jobs_per_worker)
+
+    def run(self, instance_path, k_value, formulation, threads, memorylimit, options=()):
+        with self._lock:
+            pool = self._pool
+        start_time = time.time()
+        try:
+            run_data = pool.submit(run_in_process, instance_path, k_value, formulation, threads, memorylimit, options).result()
+            print(f"  Run {instance_path.stem} k={k_value} form={formulation} finished in {time.time() - start_time:.2f}s")
+            return run_data
+        except BrokenProcessPool:
+            print(f"  ERROR: worker died during {instance_path.name} k={k_value} form={formulation}")
+            with self._lock:
+                if self._pool is pool:
+                    self._pool = self._new_pool()
+        except BaseException as e:
+            print(f"  ERROR: {instance_path.name} k={k_value} form={formulation} failed: {e!r}")
+        return None
+
+    def shutdown(self):
+        self._pool.shutdown()
+
+def collect_jobs(instance_files, formulations_to_run, completed=frozenset()):
+    """All (instance, k, formulation) runs that are not completed yet, largest estimated effort first."""
+    jobs = []
+    for instance_path in instance_files:
+        instance_name = instance_path.stem # e.g., "g01"
+        try:
+            # Read the edge arrays to determine |V| for calculating k (this also fills the instance cache)
+            num_nodes, edges = read_instance_arrays(str(instance_path))
+        except Exception as e:
+            #other errors during instance processing (e.g., reading graph)
+            print(f"  ERROR: Failed to process instance {instance_path.name}: {e}")
+            continue
+
+        k_values_for_instance = calculate_k_values(num_nodes)
+        if not k_values_for_instance:
+            print(f"  Skipping instance {instance_name} (could not determine valid k values, |V|={num_nodes}).")
+            continue
+
+        print(f"  {instance_name}: |V| = {num_nodes}, testing k values: {sorted(list(k_values_for_instance))}")
+        for k in sorted(list(k_values_for_instance)):
+            for formulation in formulations_to_run:
+                if (instance_name, k, formulation) in completed:
+                    continue
+                size = estimate_job_size(num_nodes, len(edges), k, formulation)
+                jobs.append((size, instance_path, k, formulation))
+
+    jobs.sort(key=lambda job: job[0], reverse=True)
+    return jobs
+
+def run_jobs(jobs, store, cores, memory, threads, memorylimit, runner=None, options=(), processes=lambda formulation: 1):
+    """Runs the jobs concurrently within the core and memory budget, appending each result to the store as it completes.
+
+    Every solver process of a job (processes(formulation) of them, see processes_per_run) reserves
+    `threads` cores and `memorylimit` GB (Gurobi's soft memory limit).
+    Whenever a job finishes, the largest pending jobs that fit into the free budget are started, so
+    smaller jobs backfill cores that a large job at the head of the queue has to wait for.
+    Jobs run as kmst.py subprocesses, or in the InProcessRunner if one is given.
+    """
+    def reservation(formulation):
+        # a job that exceeds the whole budget still runs, but alone
+        n = processes(formulation)
+        return min(n * threads, cores), min(n * memorylimit, memory)
+
+    free_cores, free_memory = cores, memory
+    pending = list(jobs)
+    running = {}
+    n_results = 0
+
+    with ThreadPoolExecutor(max_workers=max(1, cores // min(threads, cores))) as executor:
+        while pending or running:
+            while True:
+                # backfill: the largest pending job that fits, not only the head of the queue
+                fitting = next((i for i, job in enumerate(pending)
+                                if reservation(job[3])[0] <= free_cores and reservation(job[3])[1] <= free_memory), None)
+                if fitting is None:
+                    break
+                _, instance_path, k, formulation = pending.pop(fitting)
+                job_cores, job_memory = reservation(formulation)
+                print(f"  Starting {instance_path.stem} k={k} form={formulation} ({len(pending)} pending)")
+                if runner is not None:
+                    future = executor.submit(runner.run, instance_path, k, formulation, threads, memorylimit, options)
+                else:
+                    temp_result_path = Path(f"temp_result_{instance_path.stem}_{k}_{formulation}.json").resolve()
+                    future = executor.submit(run_single_experiment, instance_path, k, formulation, temp_result_path,
+                                             threads, memorylimit, options)
+                running[future] = (instance_path.stem, k, formulation)
+                free_cores -= job_cores
+                free_memory -= job_memory
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                instance_name, k, formulation = running.pop(future)
+                job_cores, job_memory = reservation(formulation)
+                free_cores += job_cores
+                free_memory += job_memory
+
+                result_data = future.result()
+                # If the run was successful and returned data, store it
+                if result_data:
+                    # Ensure the instance name in results is just the stem
+                    result_data['instance'] = instance_name
+                    store.append(result_data)
+                    n_results += 1
+                else:
+                    # Log skipped run if run_single_experiment returned None
+                    print(f"  Skipping results storage for failed run: {instance_name} k={k} form={formulation}")
+
+    return n_results
+
 def main():
-    """Parses arguments, runs benchmarks, and writes results to CSV."""
+    """Parses arguments, runs benchmarks in parallel into the result store, and exports it to CSV."""
     parser = argparse.ArgumentParser(description="Run k-MST benchmarks using kmst.py")
     parser.add_argument("--data-dir", type=str, default=DATA_DIR_DEFAULT,
                         help=f"Directory containing instance .dat files (default: {DATA_DIR_DEFAULT})")
     parser.add_argument("--output-csv", type=str, default=OUTPUT_CSV_DEFAULT,
                         help=f"Path to write the consolidated results CSV file (default: {OUTPUT_CSV_DEFAULT})")
+    parser.add_argument("--results-store", type=str, default=RESULTS_STORE_DEFAULT,
+                        help=f"Append-only JSONL file every finished run is written to (default: {RESULTS_STORE_DEFAULT})")
+    store_mode = parser.add_mutually_exclusive_group()
+    store_mode.add_argument("--resume", action="store_true",
+                            help="Keep the results store and skip runs that are already in it")
+    store_mode.add_argument("--overwrite", action="store_true",
+                            help="Start with an empty results store, an existing one is moved aside to <store>.<timestamp>.jsonl")
+    parser.add_argument("--export-only", action="store_true",
+                        help="Only export the results store to the CSV file, without running anything")
+    parser.add_argument("--in-process", action="store_true",
+                        help="Run the solver in worker processes that reuse the Gurobi environment and parsed instances")
+    parser.add_argument("--jobs-per-worker", type=int, default=JOBS_PER_WORKER,
+                        help=f"Replace in-process workers after this many runs (default: {JOBS_PER_WORKER})")
     # Allow specifying specific formulations to run, defaults to all
-    parser.add_argument("--formulations", nargs='+', default=FORMULATIONS, choices=FORMULATIONS,
-                        help="List of formulations to test (default: all)")
+    parser.add_argument("--formulations", nargs='+', default=BENCHMARK_FORMULATIONS, choices=FORMULATIONS + [RACE],
+                        help=f"List of formulations to test (default: {' '.join(BENCHMARK_FORMULATIONS)})")
+    parser.add_argument("--race-formulations", nargs='+', default=RACE_FORMULATIONS, choices=FORMULATIONS,
+                        help=f"Formulations raced by the {RACE} runs (default: {' '.join(RACE_FORMULATIONS)})")
+    parser.add_argument("--decompose", action="store_true",
+                        help="Solve every run as root subproblems in --workers processes; the results keep "
+                             "their formulation names, so use a separate --results-store")
+    parser.add_argument("--workers", type=int, default=2,
+                        help="Worker processes of a --decompose run (default: 2)")
+    parser.add_argument("--cores", type=int, default=os.cpu_count() or 1,
+                        help="Total number of cores used by concurrent runs (default: all)")
+    parser.add_argument("--memory", type=float, default=total_memory_gb(),
+                        help="Total memory in GB used by concurrent runs (default: physical memory)")
+    parser.add_argument("--threads", type=int, default=THREADS,
+                        help=f"Gurobi threads per run (default: {THREADS})")
+    parser.add_argument("--memorylimit", type=float, default=MEMORYLIMIT,
+                        help=f"Memory limit per run in GB (default: {MEMORYLIMIT})")
     args = parser.parse_args()
+    if args.decompose and RACE in args.formulations:
+        parser.error(f"--decompose cannot be combined with the {RACE} formulation")
 
     data_path = Path(args.data_dir)
     output_csv_path = Path(args.output_csv)
-    # Use a temporary file in the current directory for simplicity
-    #temp_result_path = Path(TEMP_RESULT_FILENAME).resolve()
+    store = ResultStore(args.results_store)
     formulations_to_run = args.formulations
 
+    if args.export_only:
+        n_rows = store.export_csv(output_csv_path)
+        print(f"Exported {n_rows} results from {store.path} to {output_csv_path}")
+        return
+
     # --- Input Validation ---
     if not data_path.is_dir():
         print(f"Error: Data directory not found: {data_path}")
@@ -148,87 +384,46 @@ def main():
 
     print(f"Found {len(instance_files)} instances in {data_path}.")
     print(f"Testing formulations: {', '.join(formulations_to_run)}")
-    print(f"Results will be saved to: {output_csv_path}")
-    print(f"Using parameters: Threads={THREADS}, Timelimit={TIMELIMIT}s, MemoryLimit={MEMORYLIMIT}GB")
+    print(f"Results will be stored in {store.path} and exported to: {output_csv_path}")
+    print(f"Using parameters: Threads={args.threads}, Timelimit={TIMELIMIT}s, MemoryLimit={args.memorylimit}GB")
+    print(f"Budget: {args.cores} cores, {args.memory:.1f}GB")
 
-    all_results = [] # List to store results dictionaries from successful runs
+    # stored results are never truncated, a new sweep needs --resume or --overwrite
+    completed = set()
+    if args.resume:
+        completed = store.completed()
+        print(f"Resuming, {len(completed)} runs already in {store.path}")
+    elif args.overwrite:
+        rotated = store.rotate()
+        if rotated is not None:
+            print(f"Moved the previous results from {store.path} to {rotated}")
+    elif not store.is_empty():
+        print(f"Error: {store.path} already holds results, pass --resume to continue them "
+              f"or --overwrite to move them aside and start over")
+        sys.exit(1)
 
-    # --- Main Benchmarking Loop ---
-    for instance_path in instance_files:
-        instance_name = instance_path.stem # e.g., "g01"
-        print(f"\nProcessing instance: {instance_path.name}")
+    jobs = collect_jobs(instance_files, formulations_to_run, completed)
+    if jobs:
+        runner = None
+        if args.in_process:
+            runner = InProcessRunner(max(1, args.cores // max(1, args.threads)), args.jobs_per_worker)
         try:
-            # Read graph to determine |V| for calculating k
-            graph = read_instance(str(instance_path))
-            num_nodes = graph.number_of_nodes()
-            k_values_for_instance = calculate_k_values(num_nodes)
-
-            if not k_values_for_instance:
-                 print(f"  Skipping instance {instance_name} (could not determine valid k values, |V|={num_nodes}).")
-                 continue
-
-            print(f"  |V| = {num_nodes}, testing k values: {sorted(list(k_values_for_instance))}")
-
-            # Loop through calculated k values
-            for k in sorted(list(k_values_for_instance)):
-                print(f" Testing k = {k}")
-                # Loop through specified formulations
-                for formulation in formulations_to_run:
-                    print(f"  Testing formulation = {formulation}")
-                    temp_result_path = Path(f"temp_result_{formulation}.json").resolve()
-                    # Run the single experiment via subprocess
-                    result_data = run_single_experiment(instance_path, k, formulation, temp_result_path)
-
-                    # If the run was successful and returned data, store it
-                    if result_data:
-                        # Ensure the instance name in results is just the stem
-                        result_data['instance'] = instance_name
-                        all_results.append(result_data)
-                    else:
-                        # Log skipped run if run_single_experiment returned None
-                        print(f"  Skipping results storage for failed run: {instance_name} k={k} form={formulation}")
-
-        except FileNotFoundError:
-             print(f"  ERROR: Instance file not found during read: {instance_path}. Skipping.")
-        except Exception as e:
-            #other errors during instance processing (e.g., reading graph)
-            print(f"  ERROR: Failed to process instance {instance_path.name}: {e}")
-            # could also stop here
-            continue
-
-   
-    if not all_results:
-        print("\nNo successful results were collected. CSV file will not be created.")
-        return
-
-    print(f"\nWriting {len(all_results)} results to {output_csv_path}...")
-
-    
-    headers = [
-        "instance",             # Instance name stem (e.g., g01)
-        "k",                    # Value of k used
-        "formulation",          # Formulation identifier (seq, scf, etc.)
-        "status",               # Gurobi status code 
-        "objective_value",      # Best objective value found
-        "best_bound",           # Best objective bound (for MIPs)
-        "gap",                  # MIPGap reported by Gurobi
-        "runtime",              # Runtime reported by Gurobi
-        "n_nodes",              # Branch-and-bound nodes explored
-        "n_lazy_constraints" ,   # Number of added constraints (for CEC/DCC, we should count this in kmst.py)
-        "is_valid_k_mst" 
-    ]
+            n_results = run_jobs(jobs, store, args.cores, args.memory, args.threads, args.memorylimit, runner,
+                                 solver_options(args), lambda formulation: processes_per_run(formulation, args))
+        finally:
+            if runner is not None:
+                runner.shutdown()
+        print(f"\nStored {n_results} of {len(jobs)} results in {store.path}")
+    else:
+        print("\nNo runs left to schedule.")
 
     try:
-        with open(output_csv_path, 'w', newline='', encoding='utf-8') as csvfile:            
-            writer = csv.DictWriter(csvfile, fieldnames=headers, extrasaction='ignore')# extrasaction='ignore' prevents errors if the JSON has extra unexpected fields
-            writer.writeheader() # Write the header row
-            writer.writerows(all_results) # Write all collected results
+        n_rows = store.export_csv(output_csv_path)
+        print(f"Exported {n_rows} results to {output_csv_path}")
         print("BENCHMARKING COMPLETE! 🥳🥳🥳")
     except IOError as e:
         print(f"Error: Could not write results to CSV file {output_csv_path}: {e}")
-    except Exception as e:
-        print(f"An unexpected error occurred during CSV writing: {e}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
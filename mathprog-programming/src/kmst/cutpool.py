@@ -0,0 +1,96 @@
+import numpy as np
+import scipy.sparse as sp
+
+# pooled cuts that were not violated in this many pool checks are dropped
+MAX_CUT_AGE = 100
+
+
+class Cut:
+    """Inequality coef @ values[index] >= rhs over the stacked variable values (y, x, r).
+
+    The index is sorted, so equal inequalities share the same key regardless of the order
+    in which a separator produced their terms.
+    """
+
+    __slots__ = ("index", "coef", "rhs", "key", "age")
+
+    def __init__(self, index, coef, rhs: float):
+        index = np.asarray(index, dtype=np.int64)
+        order = np.argsort(index, kind="stable")
+        self.index = index[order]
+        self.coef = np.broadcast_to(np.asarray(coef, dtype=np.float64), index.shape)[order]
+        self.rhs = float(rhs)
+        # the terms themselves, not their hash, so distinct cuts never collide
+        self.key = (self.index.tobytes(), self.coef.tobytes(), self.rhs)
+        self.age = 0
+
+    def violation(self, values: np.ndarray) -> float:
+        return self.rhs - self.coef @ values[self.index]
+
+
+class CutPool:
+    """Cuts added in earlier callbacks, keyed by their support.
+
+    Separated cuts that are already pooled are reported as duplicates. Before running a
+    separator, the callback checks the pooled cuts against the current solution; each
+    check counts as a hit if a pooled cut is violated and as a miss otherwise. Cuts that
+    stay satisfied for MAX_CUT_AGE checks are dropped from the pool.
+    """
+
+    def __init__(self, n_values: int):
+        self.n_values = n_values
+        self.cuts: dict[tuple, Cut] = {}
+        self.hits = 0
+        self.misses = 0
+        self.duplicates = 0
+        self._matrix = None
+        self._rhs = None
+        self._order: list[Cut] = []
+
+    def __len__(self) -> int:
+        return len(self.cuts)
+
+    def add(self, cut: Cut) -> bool:
+        """Add a cut to the pool, returns False (and counts a duplicate) if it is already pooled."""
+        if cut.key in self.cuts:
+            self.duplicates += 1
+            return False
+        self.cuts[cut.key] = cut
+        self._matrix = None
+        return True
+
+    def violated(self, values: np.ndarray, tol: float = 1e-5) -> list[Cut]:
+        """Pooled cuts violated by more than tol, most violated first. Ages the other cuts."""
+        if not self.cuts:
+            self.misses += 1
+            return []
+
+        if self._matrix is None:
+            self._build_matrix()
+        violation = self._rhs - self._matrix @ values
+
+        is_violated = violation > tol
+        expired = False
+        for cut, v in zip(self._order, is_violated):
+            cut.age = 0 if v else cut.age + 1
+            expired |= cut.age > MAX_CUT_AGE
+        result = [self._order[i] for i in np.flatnonzero(is_violated)[np.argsort(-violation[is_violated])]]
+
+        if expired:
+            self.cuts = {key: cut for key, cut in self.cuts.items() if cut.age <= MAX_CUT_AGE}
+            self._matrix = None
+
+        if result:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return result
+
+    def _build_matrix(self):
+        self._order = list(self.cuts.values())
+        indptr = np.zeros(len(self._order) + 1, dtype=np.int64)
+        np.cumsum([len(cut.index) for cut in self._order], out=indptr[1:])
+        indices = np.concatenate([cut.index for cut in self._order])
+        data = np.concatenate([cut.coef for cut in self._order])
+        self._matrix = sp.csr_array((data, indices, indptr), shape=(len(self._order), self.n_values))
+        self._rhs = np.array([cut.rhs for cut in self._order])
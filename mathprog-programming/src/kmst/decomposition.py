@@ -0,0 +1,232 @@
+import argparse
+import math
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import gurobipy as gp
+from gurobipy import GRB
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse import csgraph
+
+from graph import Graph
+from heuristic import KTree, build_adjacency, prim_k_tree
+from kmst import COUNTERS, build_results, configure_model, model_counters, preprocess
+from lagrangian import solve_lagrangian
+from model import create_model, get_selected_edge_ids, lazy_constraint_callback, set_start
+from profiling import Profile
+from reduction import reduce_graph
+from util import DisjointSet, init_worker, worker_env, worker_state, write_solution
+
+# subgradient iterations of the Lagrangian bound of a subproblem, its graph is solved by the MIP anyway
+SUBPROBLEM_ITERATIONS = 100
+# a subproblem whose lower bound is within this of the incumbent cannot improve it
+TOL = 1e-6
+
+
+def candidate_roots(G: Graph, k: int) -> list[int]:
+    """Node positions i whose component in the subgraph of the nodes i, i+1, ... has at least k nodes.
+
+    These are the roots of the subproblems: every k-tree is found in exactly the subproblem
+    of its first node. The components are built by union-find, adding the nodes backwards.
+    """
+    components = DisjointSet(G.n)
+    roots = []
+    for v in range(G.n - 1, -1, -1):
+        for w in G.adj_node[G.indptr[v]:G.indptr[v + 1]].tolist():
+            if w > v:
+                components.union(v, w)
+        if components.size[components.find(v)] >= k:
+            roots.append(v)
+    return roots[::-1]
+
+
+def root_subgraph(G: Graph, root: int) -> Graph:
+    """The component of root in the subgraph of the nodes root, root+1, ...; root is its first node."""
+    H = G.subgraph(np.arange(G.n) >= root)
+    adjacency = sp.coo_array((np.ones(H.m), (H.tail, H.head)), shape=(H.n, H.n))
+    _, label = csgraph.connected_components(adjacency, directed=False)
+    return H.subgraph(label == label[0])
+
+
+def root_tree(H: Graph, k: int) -> KTree | None:
+    """Prim's k-tree grown from the first node of H, with the root first as start_values expects."""
+    tree = prim_k_tree(build_adjacency(H), 0, k)
+    if tree is None:
+        return None
+    return KTree(np.r_[0, tree.nodes[tree.nodes != 0]], tree.edges, tree.cost)
+
+
+def root_callback(model: gp.Model, where):
+    lazy_constraint_callback(model, where)
+    if where != GRB.Callback.MIP:
+        return
+
+    # publish the incumbent of this subproblem and stop once no tree in it can beat the shared one
+    incumbent = model._shared_incumbent
+    best, bound = model.cbGet(GRB.Callback.MIP_OBJBST), model.cbGet(GRB.Callback.MIP_OBJBND)
+    with incumbent.get_lock():
+        if best < incumbent.value:
+            incumbent.value = best
+        shared = incumbent.value
+    if bound >= shared - TOL:
+        model._pruned = True
+        model.terminate()
+
+
+def solve_root(root: int, deadline: float) -> dict:
+    """Solves the subproblem with the node at position root as the root and the nodes before it excluded.
+
+    Runs in a worker process. The subproblem is pruned without a model if the reductions
+    remove the root or its Lagrangian bound reaches the shared incumbent. Trees found by the
+    MIP are published to the other workers, whose bounds are compared with them in the
+    callback; only the solution values travel, the tree itself is returned to the caller.
+    """
+    # the graph, the options and the shared incumbent value of solve_decomposed
+    G, args, incumbent = worker_state()
+    k = args.k
+    profile = Profile()
+    result = {"root": root, "status": "pruned", "bound": math.inf, "objective": math.inf, "edge_ids": None,
+              "runtime": 0.0, "n_nodes": 0, **dict.fromkeys(COUNTERS, 0), "profile": profile}
+
+    H = root_subgraph(G, root)
+    root_label = G.labels[root]
+    upper_bound = incumbent.value
+    if args.reduction:
+        with profile.phase("reduction"):
+            H = reduce_graph(H, k, upper_bound)
+        if H.n == 0 or H.labels[0] != root_label:
+            return result
+
+    # any k-tree of H costs at least its k-1 cheapest edges
+    bound = float(np.sort(H.cost)[:k - 1].sum())
+    if args.lagrangian:
+        with profile.phase("lagrangian"):
+            lagrangian = solve_lagrangian(H, k, upper_bound, SUBPROBLEM_ITERATIONS)
+        if lagrangian is None or lagrangian.bound >= incumbent.value - TOL or lagrangian.fixed_nodes[0]:
+            return result
+        bound = max(bound, lagrangian.bound)
+        H = H.subgraph(~lagrangian.fixed_nodes, ~lagrangian.fixed_edges)
+        if args.reduction:
+            with profile.phase("reduction"):
+                H = reduce_graph(H, k, upper_bound)
+            if H.n == 0 or H.labels[0] != root_label:
+                return result
+
+    time_left = deadline - time.time()
+    if time_left <= 0:
+        result.update(status="timeout", bound=bound)
+        return result
+
+    with gp.Model(f"root{root_label}", env=worker_env()) as model:
+        model._original_graph = H
+        model._k = k
+        model._formulation = args.formulation
+        model._heuristic = args.heuristic_roots > 0
+        model._cut_rounds, model._cut_nodes, model._cut_violation = args.cut_rounds, args.cut_nodes, args.cut_violation
+        model._shared_incumbent = incumbent
+        model._pruned = False
+
+        with profile.phase("create_model"):
+            create_model(model)
+        model._profile = profile
+
+        # the root is the first node of H, without root variables only its node variable is fixed
+        model._x[0].LB = 1
+        if model._r is not None:
+            model._r[0].LB = 1
+        with profile.phase("update"):
+            model.update()
+
+        tree = root_tree(H, k)
+        if tree is not None:
+            set_start(model, tree)
+
+        configure_model(model, args)
+        model.Params.TimeLimit = time_left
+        if math.isfinite(incumbent.value):
+            model.Params.Cutoff = incumbent.value
+        with profile.phase("optimize"):
+            model.optimize(root_callback)
+
+        if model.SolCount > 0:
+            result.update(objective=model.ObjVal, edge_ids=get_selected_edge_ids(model))
+        if model.Status == GRB.TIME_LIMIT:
+            result.update(status="timeout", bound=max(bound, model.ObjBound))
+        elif model.Status in (GRB.OPTIMAL, GRB.CUTOFF, GRB.INFEASIBLE) or model._pruned:
+            result["status"] = "solved"
+        else:
+            result.update(status="timeout", bound=bound)
+        result.update(runtime=model.Runtime, n_nodes=round(model.NodeCount), **model_counters(model))
+    return result
+
+
+def solve_decomposed(G: Graph, args: argparse.Namespace, profile: Profile | None = None) -> dict:
+    """Solves the instance as one subproblem per root in a pool of args.workers processes.
+
+    The formulations leave the choice of the root to the solver, so every k-tree is
+    represented once per node. Here the node order breaks this symmetry: the subproblem
+    of node i fixes i as the root and excludes all nodes before it. The preprocessing of
+    solve runs once on the whole graph; the start tree's cost is the first shared incumbent.
+    The results have the keys of kmst.solve (see kmst.build_results); the runtime, the node
+    and cut counts and the phase times of the subproblems add up over the workers.
+    """
+    profile = profile or Profile()
+    start_time = time.time()
+    deadline = start_time + args.timelimit
+    tree, lagrangian, H = preprocess(G, args, profile)
+
+    best_cost = tree.cost if tree is not None else math.inf
+    best_edges = H.ids[tree.edges].tolist() if tree is not None else None
+    roots = candidate_roots(H, args.k)
+    print(f"Decomposing into {len(roots)} root subproblems on {args.workers} workers")
+
+    context = multiprocessing.get_context("spawn")
+    incumbent = context.Value("d", best_cost)
+    subproblems = []
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context, initializer=init_worker,
+                             initargs=(H, args, incumbent)) as pool:
+        # the first roots have the largest subgraphs, so they are started first
+        futures = {pool.submit(solve_root, root, deadline): root for root in roots}
+        for future in as_completed(futures):
+            # a subproblem that fails (e.g. its model is too large) leaves its part of the search space unproven
+            try:
+                subproblem = future.result()
+            except Exception as e:
+                root = futures[future]
+                print(f"Root {H.labels[root]} failed: {e!r}")
+                subproblems.append({"root": root, "status": "failed", "bound": -math.inf, "objective": math.inf,
+                                    "edge_ids": None, "runtime": 0.0, "n_nodes": 0, **dict.fromkeys(COUNTERS, 0)})
+                continue
+            profile.add(subproblem.pop("profile"))
+            subproblems.append(subproblem)
+            if subproblem["edge_ids"] is not None and subproblem["objective"] < best_cost - TOL:
+                best_cost, best_edges = subproblem["objective"], subproblem["edge_ids"]
+                print(f"New incumbent {best_cost:g} with root {H.labels[subproblem['root']]}")
+
+    # solved and pruned subproblems cannot beat the incumbent, the others are bounded by their own bound
+    # (failed ones by none)
+    timeouts = [s for s in subproblems if s["status"] == "timeout"]
+    failed = [s for s in subproblems if s["status"] == "failed"]
+    best_bound = min([best_cost] + [s["bound"] for s in timeouts + failed])
+    if timeouts:
+        status = GRB.TIME_LIMIT
+    elif failed:
+        status = GRB.INTERRUPTED
+    else:
+        status = GRB.OPTIMAL if best_edges is not None else GRB.INFEASIBLE
+
+    # the workers run in parallel, so the wall time is measured here instead of added up from the phases
+    wall_time = profile.phases["read"] + time.time() - start_time
+    counters = {key: sum(s[key] for s in subproblems) for key in COUNTERS}
+    results = build_results(args, G, args.k, args.formulation, status, best_cost, best_bound,
+                            sum(s["runtime"] for s in subproblems), sum(s["n_nodes"] for s in subproblems), best_edges,
+                            tree, lagrangian, G.n - H.n, G.m - H.m, counters, profile, wall_time=wall_time)
+    results["n_subproblems"] = len(roots)
+    results["n_pruned_subproblems"] = sum(s["status"] == "pruned" for s in subproblems)
+    results["n_failed_subproblems"] = len(failed)
+
+    if args.solution_file and best_edges is not None:
+        write_solution(args.solution_file, best_edges)
+    return results
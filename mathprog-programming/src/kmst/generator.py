@@ -0,0 +1,187 @@
+import argparse
+import math
+
+import numpy as np
+from scipy.sparse import csgraph, coo_array
+from scipy.spatial import cKDTree
+
+FAMILIES = ["random", "geometric", "grid", "scale-free"]
+# edge costs of the non-geometric families are drawn from 1..MAX_COST-1, as in the g*.dat instances
+MAX_COST = 1000
+# geometric costs are distances scaled so that the typical nearest-neighbour edge costs about this much
+GEOMETRIC_SCALE = 100
+# edges per block written to the instance file
+WRITE_CHUNK = 1 << 18
+
+
+def random_tree(n: int, rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    """Random spanning tree: in a random node order, every node attaches to a uniformly chosen earlier node."""
+    order = rng.permutation(n)
+    parent = rng.integers(0, np.arange(1, n)) if n > 1 else np.zeros(0, dtype=np.int64)
+    return order[parent], order[1:]
+
+
+def add_random_edges(n: int, tail: np.ndarray, head: np.ndarray, m: int, rng: np.random.Generator):
+    """Extends the edges to m by uniformly chosen new node pairs.
+
+    Sparse graphs sample pairs in batches and drop duplicates; above half of all pairs the
+    missing edges are chosen among the enumerated free pairs instead, so the density bound
+    can be reached without rejection.
+    """
+    n_pairs = n * (n - 1) // 2
+    if m > n_pairs:
+        raise ValueError(f"{m} edges do not fit a simple graph on {n} nodes")
+    key = np.minimum(tail, head).astype(np.int64) * n + np.maximum(tail, head)
+    need = m - len(key)
+    if need <= 0:
+        return tail, head
+
+    if m > n_pairs // 2:
+        i, j = np.triu_indices(n, 1)
+        free = np.setdiff1d(i.astype(np.int64) * n + j, key, assume_unique=True)
+        new = rng.choice(free, need, replace=False)
+    else:
+        new = np.zeros(0, dtype=np.int64)
+        while len(new) < need:
+            i, j = rng.integers(0, n, (2, int(1.1 * (need - len(new))) + 16))
+            candidates = np.minimum(i, j) * n + np.maximum(i, j)
+            candidates = np.setdiff1d(candidates[i != j], np.concatenate((key, new)))
+            if len(candidates) > need - len(new):
+                candidates = rng.choice(candidates, need - len(new), replace=False)
+            new = np.concatenate((new, candidates))
+
+    return np.concatenate((tail, new // n)), np.concatenate((head, new % n))
+
+
+def random_connected(n: int, m: int, rng: np.random.Generator):
+    """Random spanning tree plus uniformly random further edges."""
+    tail, head = random_tree(n, rng)
+    tail, head = add_random_edges(n, tail, head, m, rng)
+    return tail, head, rng.integers(1, MAX_COST, len(tail))
+
+
+def geometric(n: int, m: int, rng: np.random.Generator):
+    """Uniform points in the unit square, connected by the m shortest edges of their nearest-neighbour graph
+    that include a spanning tree; costs are the scaled Euclidean distances."""
+    points = rng.random((n, 2))
+    k = min(n - 1, math.ceil(2 * m / n) + 1)
+    dist, nearest = cKDTree(points).query(points, k + 1)
+    i = np.repeat(np.arange(n), k)
+    j = nearest[:, 1:].ravel()
+    key, first = np.unique(np.minimum(i, j).astype(np.int64) * n + np.maximum(i, j), return_index=True)
+    length = dist[:, 1:].ravel()[first]
+    tail, head = key // n, key % n
+
+    # minimum spanning forest of the candidates, components are chained by their first nodes
+    forest = csgraph.minimum_spanning_tree(coo_array((length + 1e-12, (tail, head)), shape=(n, n)).tocsr()).tocoo()
+    tree_key = np.minimum(forest.row, forest.col).astype(np.int64) * n + np.maximum(forest.row, forest.col)
+    n_components, labels = csgraph.connected_components(forest, directed=False)
+    if n_components > 1:
+        _, representative = np.unique(labels, return_index=True)
+        a, b = representative[:-1], representative[1:]
+        tree_key = np.concatenate((tree_key, np.minimum(a, b).astype(np.int64) * n + np.maximum(a, b)))
+
+    rest = ~np.isin(key, tree_key)
+    rest_key = key[rest][np.argsort(length[rest], kind="stable")]
+    key = np.concatenate((tree_key, rest_key[:max(m - len(tree_key), 0)]))
+    tail, head = key // n, key % n
+    length = np.linalg.norm(points[tail] - points[head], axis=1)
+    cost = np.maximum(1, np.rint(GEOMETRIC_SCALE * math.sqrt(n) * length)).astype(np.int64)
+    return tail, head, cost
+
+
+def grid(n: int, m: int | None, rng: np.random.Generator):
+    """Nearly square grid with n nodes (the last row may be partial); m is ignored."""
+    cols = math.ceil(math.sqrt(n))
+    v = np.arange(n)
+    right = v[(v % cols < cols - 1) & (v + 1 < n)]
+    down = v[v + cols < n]
+    tail = np.concatenate((right, down))
+    head = np.concatenate((right + 1, down + cols))
+    return tail, head, rng.integers(1, MAX_COST, len(tail))
+
+
+def scale_free(n: int, m: int, rng: np.random.Generator):
+    """Preferential attachment (Barabasi-Albert) with about m / (n - 1) edges per new node.
+
+    Uses the endpoint-copy construction of Batagelj and Brandes: the target of an edge is
+    the node at a uniformly random earlier position of the endpoint list. The positions are
+    drawn for all edges at once and resolved by pointer jumping. The first edge of every
+    node only sees earlier nodes, so these edges form a spanning tree; self-loops and
+    parallel edges are dropped and the edge count is then adjusted to m.
+    """
+    d = max(1, math.ceil(m / max(n - 1, 1)))
+    source = np.repeat(np.arange(1, n), d)
+    n_new = len(source)
+    first = np.arange(n_new) % d == 0
+
+    # endpoint list: two seed slots holding node 0, then (source, target) per edge
+    node = np.zeros(2 + 2 * n_new, dtype=np.int64)
+    node[2::2] = source
+    pointer = np.arange(2 + 2 * n_new)
+    own = 2 + 2 * np.arange(n_new)
+    pointer[3::2] = rng.integers(0, np.where(first, own, own + 1))
+    while True:
+        jumped = pointer[pointer]
+        if np.array_equal(jumped, pointer):
+            break
+        pointer = jumped
+    target = node[pointer[3::2]]
+
+    keep = source != target
+    tail, head, tree = source[keep], target[keep], first[keep]
+    key, unique = np.unique(np.minimum(tail, head) * n + np.maximum(tail, head), return_index=True)
+    tree = tree[unique]
+
+    # keep the tree and a random selection of the other edges
+    extra = rng.permutation(np.flatnonzero(~tree))[:max(m - tree.sum(), 0)]
+    key = np.concatenate((key[tree], key[extra]))
+    tail, head = add_random_edges(n, key // n, key % n, m, rng)
+    return tail, head, rng.integers(1, MAX_COST, len(tail))
+
+
+def generate(family: str, n_nodes: int, n_edges: int | None = None, seed: int = 42):
+    """Connected random instance of the family as (tail, head, cost) arrays over the nodes 0..n-1.
+
+    The edges are sorted by (tail, head) with tail < head, the same seed gives the same instance.
+    """
+    rng = np.random.default_rng(seed)
+    if family == "grid":
+        tail, head, cost = grid(n_nodes, n_edges, rng)
+    else:
+        if n_edges is None or n_edges < n_nodes - 1:
+            raise ValueError(f"a connected {family} instance on {n_nodes} nodes needs at least {n_nodes - 1} edges")
+        generators = {"random": random_connected, "geometric": geometric, "scale-free": scale_free}
+        tail, head, cost = generators[family](n_nodes, n_edges, rng)
+
+    tail, head = np.minimum(tail, head), np.maximum(tail, head)
+    order = np.lexsort((head, tail))
+    return tail[order], head[order], cost[order]
+
+
+def write_dat(filename: str, n_nodes: int, tail: np.ndarray, head: np.ndarray, cost: np.ndarray):
+    """Writes edge arrays in the instance format (ids 0..m-1, nodes 1..n) in blocks of WRITE_CHUNK edges."""
+    with open(filename, "w", encoding="utf-8") as f:
+        f.write(f"{n_nodes}\n{len(tail)}\n")
+        for start in range(0, len(tail), WRITE_CHUNK):
+            stop = min(start + WRITE_CHUNK, len(tail))
+            block = np.column_stack((np.arange(start, stop), tail[start:stop] + 1, head[start:stop] + 1, cost[start:stop]))
+            np.savetxt(f, block, fmt="%d")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate random k-MST instances")
+    parser.add_argument("--family", choices=FAMILIES, default="random")
+    parser.add_argument("--nodes", type=int, required=True, help="number of nodes")
+    parser.add_argument("--edges", type=int, help="number of edges (ignored for grids)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=str, required=True, help="path of the instance file")
+    args = parser.parse_args()
+
+    tail, head, cost = generate(args.family, args.nodes, args.edges, args.seed)
+    write_dat(args.output, args.nodes, tail, head, cost)
+    print(f"Wrote {args.family} instance with {args.nodes} nodes and {len(tail)} edges to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
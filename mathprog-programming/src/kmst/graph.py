@@ -0,0 +1,103 @@
+import networkx as nx
+import numpy as np
+
+from util import DisjointSet, read_instance_arrays
+
+
+class Graph:
+    """Undirected instance graph stored as arrays.
+
+    Nodes are the positions 0..n-1, labels holds their names in the instance file. Edge e
+    joins the node positions tail[e] and head[e] and has a cost and an instance id. The
+    adjacency is a CSR structure over both orientations: the neighbours of node v are
+    adj_node[indptr[v]:indptr[v + 1]], reached via the edges adj_edge[indptr[v]:indptr[v + 1]].
+    """
+
+    __slots__ = ("labels", "tail", "head", "cost", "ids", "indptr", "adj_node", "adj_edge")
+
+    def __init__(self, labels, tail, head, cost, ids):
+        self.labels = np.asarray(labels, dtype=np.int64)
+        self.tail = np.asarray(tail, dtype=np.int64)
+        self.head = np.asarray(head, dtype=np.int64)
+        self.cost = np.asarray(cost)
+        self.ids = np.asarray(ids, dtype=np.int64)
+
+        n, m = len(self.labels), len(self.tail)
+        source = np.concatenate((self.tail, self.head))
+        order = np.argsort(source, kind="stable")
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(source, minlength=n), out=self.indptr[1:])
+        self.adj_node = np.concatenate((self.head, self.tail))[order]
+        self.adj_edge = order % m if m else order
+
+    @classmethod
+    def read(cls, filename: str, cache: bool = True) -> "Graph":
+        """Reads an instance file, nodes are labelled 1..n as in util.read_instance."""
+        n_nodes, edges = read_instance_arrays(filename, cache)
+        edges = np.asarray(edges)
+        return cls(np.arange(1, n_nodes + 1), edges[:, 1] - 1, edges[:, 2] - 1, edges[:, 3], edges[:, 0])
+
+    @classmethod
+    def from_networkx(cls, G: nx.Graph) -> "Graph":
+        labels = list(G.nodes)
+        node_pos = {v: p for p, v in enumerate(labels)}
+        m = G.number_of_edges()
+        tail = np.fromiter((node_pos[i] for i, _ in G.edges), dtype=np.int64, count=m)
+        head = np.fromiter((node_pos[j] for _, j in G.edges), dtype=np.int64, count=m)
+        cost = np.array([c for _, _, c in G.edges(data="cost")])
+        ids = np.fromiter((i for _, _, i in G.edges(data="id")), dtype=np.int64, count=m)
+        return cls(labels, tail, head, cost, ids)
+
+    def to_networkx(self, edges: np.ndarray | None = None) -> nx.Graph:
+        """The graph (or, if edge positions are given, the subgraph formed by these edges) as nx.Graph."""
+        G = nx.Graph()
+        if edges is None:
+            G.add_nodes_from(self.labels.tolist())
+            edges = np.arange(self.m)
+        G.add_edges_from((i, j, {"id": e, "cost": c}) for i, j, e, c in zip(
+            self.labels[self.tail[edges]].tolist(), self.labels[self.head[edges]].tolist(),
+            self.ids[edges].tolist(), self.cost[edges].tolist()))
+        return G
+
+    @property
+    def n(self) -> int:
+        return len(self.labels)
+
+    @property
+    def m(self) -> int:
+        return len(self.tail)
+
+    def degree(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    def subgraph(self, keep_node: np.ndarray, keep_edge: np.ndarray | None = None) -> "Graph":
+        """Subgraph on the kept node (and edge) positions, edges need both endpoints kept.
+
+        Labels and edge ids are preserved, see node_index and edge_index to map positions.
+        """
+        keep_node = np.asarray(keep_node, dtype=bool)
+        keep = keep_node[self.tail] & keep_node[self.head]
+        if keep_edge is not None:
+            keep &= keep_edge
+        position = np.cumsum(keep_node) - 1
+        return Graph(self.labels[keep_node], position[self.tail[keep]], position[self.head[keep]],
+                     self.cost[keep], self.ids[keep])
+
+    def node_index(self, labels) -> np.ndarray:
+        """Positions of the nodes with the given labels."""
+        order = np.argsort(self.labels)
+        return order[np.searchsorted(self.labels, labels, sorter=order)]
+
+    def edge_index(self, ids) -> np.ndarray:
+        """Positions of the edges with the given instance ids."""
+        order = np.argsort(self.ids)
+        return order[np.searchsorted(self.ids, ids, sorter=order)]
+
+    def forest_stats(self, edges: np.ndarray) -> tuple[int, int, bool]:
+        """Number of nodes and connected components of the subgraph formed by the given edges, and whether it is acyclic."""
+        components = DisjointSet(self.n)
+        acyclic = True
+        for i, j in zip(self.tail[edges].tolist(), self.head[edges].tolist()):
+            acyclic &= components.union(i, j)
+        nodes = np.unique(np.concatenate((self.tail[edges], self.head[edges])))
+        return len(nodes), len({components.find(v) for v in nodes.tolist()}), acyclic
@@ -0,0 +1,214 @@
+import heapq
+
+import numpy as np
+
+from graph import Graph
+
+# number of root nodes Prim's growth is started from
+DEFAULT_ROOTS = 32
+
+
+class KTree:
+    """A k-tree given by its node and edge positions in a Graph."""
+
+    __slots__ = ("nodes", "edges", "cost")
+
+    def __init__(self, nodes, edges, cost: float):
+        self.nodes = np.asarray(nodes, dtype=np.int64)
+        self.edges = np.asarray(edges, dtype=np.int64)
+        self.cost = float(cost)
+
+    def orient(self, tail: np.ndarray, head: np.ndarray, root: int | None = None):
+        """Orient the tree away from root (default: its first node).
+
+        Returns the root and, for every tree node, the arc entering it (arc e is edge e as
+        (tail, head), arc e + m its reverse; the root has none), its depth and the size of
+        the subtree below it.
+        """
+        m = len(tail)
+        root = int(self.nodes[0]) if root is None else root
+
+        neighbours = {int(v): [] for v in self.nodes}
+        for e in self.edges:
+            neighbours[int(tail[e])].append((int(head[e]), e))
+            neighbours[int(head[e])].append((int(tail[e]), e + m))
+
+        depth = {root: 0}
+        order = [root]
+        parent = {}
+        for v in order:
+            for w, a in neighbours[v]:
+                if w not in depth:
+                    depth[w] = depth[v] + 1
+                    parent[w] = (v, a)
+                    order.append(w)
+
+        size = dict.fromkeys(order, 1)
+        for w in reversed(order[1:]):
+            size[parent[w][0]] += size[w]
+
+        return root, parent, depth, size
+
+
+def build_adjacency(G: Graph, cost: np.ndarray | None = None) -> list[list[tuple]]:
+    """Per node the (cost, neighbour, edge) tuples of its edges, as used by prim_k_tree."""
+    cost = (G.cost if cost is None else cost)[G.adj_edge].tolist()
+    neighbour, edge = G.adj_node.tolist(), G.adj_edge.tolist()
+    return [list(zip(cost[a:b], neighbour[a:b], edge[a:b])) for a, b in zip(G.indptr[:-1].tolist(), G.indptr[1:].tolist())]
+
+
+def prim_k_tree(adjacency: list[list[tuple]], root: int, k: int) -> KTree | None:
+    """Grow a tree from root by repeatedly adding the cheapest edge leaving it, until it has k nodes."""
+    in_tree = {root}
+    edges = []
+    cost = 0.0
+    heap = list(adjacency[root])
+    heapq.heapify(heap)
+    while len(in_tree) < k and heap:
+        c, v, e = heapq.heappop(heap)
+        if v in in_tree:
+            continue
+        in_tree.add(v)
+        edges.append(e)
+        cost += c
+        for item in adjacency[v]:
+            if item[1] not in in_tree:
+                heapq.heappush(heap, item)
+
+    if len(in_tree) < k:
+        return None
+    return KTree(list(in_tree), edges, cost)
+
+
+def improve_leaf_swaps(tree: KTree, n: int, tail: np.ndarray, head: np.ndarray, cost: np.ndarray) -> KTree:
+    """Local search: replace the most expensive leaf by the cheapest edge to a node outside the tree.
+
+    A leaf edge (l, p) can be exchanged for a boundary edge (u, v) with u != l in the tree
+    and v outside; the result is again a k-tree. Stops when no exchange improves the cost.
+    """
+    if len(tree.edges) < 2:
+        return tree
+
+    in_tree = np.zeros(n, dtype=bool)
+    in_tree[tree.nodes] = True
+    edges = set(tree.edges.tolist())
+    total = tree.cost
+
+    for _ in range(len(tail)):
+        tree_edges = np.fromiter(edges, dtype=np.int64, count=len(edges))
+        degree = np.bincount(tail[tree_edges], minlength=n) + np.bincount(head[tree_edges], minlength=n)
+
+        # leaf edges, most expensive first
+        leaf_of = np.where(degree[tail[tree_edges]] == 1, tail[tree_edges], head[tree_edges])
+        is_leaf_edge = degree[leaf_of] == 1
+        leaf_edges, leaves = tree_edges[is_leaf_edge], leaf_of[is_leaf_edge]
+        order = np.argsort(-cost[leaf_edges])
+
+        boundary = np.flatnonzero(in_tree[tail] != in_tree[head])
+        if len(boundary) == 0:
+            break
+        inner = np.where(in_tree[tail[boundary]], tail[boundary], head[boundary])
+        boundary_order = np.argsort(cost[boundary], kind="stable")
+
+        swapped = False
+        for le, leaf in zip(leaf_edges[order], leaves[order]):
+            # cheapest boundary edge that does not hang off the leaf itself
+            candidates = boundary_order[inner[boundary_order] != leaf]
+            if len(candidates) == 0:
+                continue
+            b = candidates[0]
+            e = boundary[b]
+            if cost[e] >= cost[le] - 1e-9:
+                continue
+
+            outer = tail[e] if inner[b] == head[e] else head[e]
+            in_tree[leaf] = False
+            in_tree[outer] = True
+            edges.remove(int(le))
+            edges.add(int(e))
+            total += cost[e] - cost[le]
+            swapped = True
+            break
+
+        if not swapped:
+            break
+
+    return KTree(np.flatnonzero(in_tree), sorted(edges), total)
+
+
+def construct_k_tree(G: Graph, k: int, n_roots: int = DEFAULT_ROOTS) -> KTree | None:
+    """Prim-style k-tree growth from several roots followed by leaf-swap improvement.
+
+    The roots are the endpoints of the cheapest edges, which are the most promising
+    starting points; with n_roots >= |V| every node is tried. Returns None if no root
+    lies in a component with at least k nodes.
+    """
+    n, tail, head, cost = G.n, G.tail, G.head, G.cost
+    if k <= 1 or len(tail) == 0:
+        return KTree([0], [], 0) if n and k == 1 else None
+
+    if n_roots >= n:
+        roots = np.arange(n)
+    else:
+        cheapest = np.argsort(cost, kind="stable")
+        roots = np.unique(np.stack((tail[cheapest], head[cheapest]), axis=1).ravel(), return_index=True)
+        roots = roots[0][np.argsort(roots[1])][:n_roots]
+
+    adjacency = build_adjacency(G)
+    best = None
+    for root in roots:
+        tree = prim_k_tree(adjacency, int(root), k)
+        if tree is not None:
+            tree = improve_leaf_swaps(tree, n, tail, head, cost)
+            if best is None or tree.cost < best.cost:
+                best = tree
+    return best
+
+
+def resize_k_tree(G: Graph, tree: KTree, k: int) -> KTree | None:
+    """Turn a tree into a k-tree by dropping its most expensive leaves or adding the cheapest boundary edges.
+
+    Used to warm-start a solve for k from the optimal tree of a neighbouring k. The result
+    is improved with leaf swaps; returns None if the component of the tree has fewer than k nodes.
+    """
+    n, tail, head, cost = G.n, G.tail, G.head, G.cost
+    in_tree = np.zeros(n, dtype=bool)
+    in_tree[tree.nodes] = True
+    edges = set(tree.edges.tolist())
+
+    while in_tree.sum() > max(k, 1):
+        if not edges:
+            in_tree[np.flatnonzero(in_tree)[1:]] = False
+            break
+        tree_edges = np.fromiter(edges, dtype=np.int64, count=len(edges))
+        degree = np.bincount(tail[tree_edges], minlength=n) + np.bincount(head[tree_edges], minlength=n)
+        is_leaf_edge = (degree[tail[tree_edges]] == 1) | (degree[head[tree_edges]] == 1)
+        leaf_edges = tree_edges[is_leaf_edge]
+        e = leaf_edges[np.argmax(cost[leaf_edges])]
+        in_tree[tail[e] if degree[tail[e]] == 1 else head[e]] = False
+        edges.remove(int(e))
+
+    while in_tree.sum() < k:
+        boundary = np.flatnonzero(in_tree[tail] != in_tree[head])
+        if len(boundary) == 0:
+            return None
+        e = boundary[np.argmin(cost[boundary])]
+        in_tree[tail[e]] = in_tree[head[e]] = True
+        edges.add(int(e))
+
+    edges = sorted(edges)
+    tree = KTree(np.flatnonzero(in_tree), edges, cost[edges].sum())
+    return improve_leaf_swaps(tree, n, tail, head, cost)
+
+
+def guided_k_tree(G: Graph, z: np.ndarray, x: np.ndarray, k: int) -> KTree | None:
+    """Prim growth on costs scaled by 1 - z (an LP solution on the edges) from the node with the largest x.
+
+    The tree is then improved with leaf swaps on the true costs.
+    """
+    guided = G.cost * (1 - np.clip(z, 0, 1)) + 1e-6 * G.cost
+    tree = prim_k_tree(build_adjacency(G, guided), int(np.argmax(x)), k)
+    if tree is None:
+        return None
+    tree = KTree(tree.nodes, tree.edges, G.cost[tree.edges].sum())
+    return improve_leaf_swaps(tree, G.n, G.tail, G.head, G.cost)
@@ -1,130 +1,419 @@
 import argparse
 import gurobipy as gp
 import json
+import math
+import numpy as np
+import os
 from pathlib import Path
-import networkx as nx
 import sys
 
-from model import create_model, lazy_constraint_callback, get_selected_edge_ids
-from util import read_instance, write_solution
-from visuals import plot_graph
+from graph import Graph
+from heuristic import DEFAULT_ROOTS, KTree, construct_k_tree, resize_k_tree
+from model import (create_model, lazy_constraint_callback, get_selected_edge_ids, set_start, update_k,
+                   fix_variables, add_pool_constraints, get_solution_tree)
+from lagrangian import LagrangianBound, solve_lagrangian
+from profiling import Profile
+from reduction import reduce_graph, transfer_tree
+from util import write_solution
 
-if __name__ == "__main__":
-    # parse command line arguments
+FORMULATIONS = ["seq", "seq+", "scf", "scf+", "mcf", "mcf-lazy", "cec", "dcc"]
+# mcf-lazy builds the dcc model (see model.create_model), so benchmarks run it only if asked for
+BENCHMARK_FORMULATIONS = [formulation for formulation in FORMULATIONS if formulation != "mcf-lazy"]
+# formulations started by --formulation race
+RACE_FORMULATIONS = ["seq", "scf", "dcc"]
+# formulations that separate their cuts as lazy constraints at every node anyway
+LAZY_FORMULATIONS = {"cec", "dcc", "mcf-lazy"}
+# separator and cut pool counters of the results, added up over the workers of the race and the decomposition
+COUNTERS = ("n_lazy_constraints", "n_user_cuts", "n_pool_hits", "n_pool_misses", "n_pool_duplicates")
+# defaults of the cut loop of the compact formulations
+CUT_NODES = 10
+CUT_VIOLATION = 0.05
+
+
+def parse_k(value: str) -> int | list[int]:
+    """A single k ("5"), a list ("5,10,20") or an inclusive range with step ("5:50:5")."""
+    try:
+        if ":" in value:
+            start, stop, *step = (int(v) for v in value.split(":"))
+            ks = list(range(start, stop + 1, step[0] if step else 1))
+        else:
+            ks = [int(v) for v in value.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid k {value!r}, expected e.g. 5, 5,10,20 or 5:50:5")
+    if not ks:
+        raise argparse.ArgumentTypeError(f"empty range of k {value!r}")
+    return ks[0] if len(ks) == 1 and ":" not in value else ks
+
+
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="ILP-based k-MST solver")
     parser.add_argument("--instance", type=str, required=True, help="path to instance file")
-    parser.add_argument("--k", type=int, required=True, help="instance parameter k")
-    parser.add_argument("--formulation", required=True, choices=["seq", "scf", "mcf", "cec", "dcc"])
+    parser.add_argument("--k", type=parse_k, required=True,
+                        help="instance parameter k; a list (5,10,20) or range (5:50:5) solves all of them with one model")
+    parser.add_argument("--formulation", required=True, choices=FORMULATIONS + ["race"],
+                        help="race solves with the --race-formulations in parallel and stops when the first one is optimal")
     parser.add_argument("--results-file", type=str, help="path to results file")
     parser.add_argument("--solution-file", type=str, help="path to solution file")
     parser.add_argument("--threads", type=int, default=1, help="maximum number of threads to use")
     parser.add_argument("--timelimit", type=int, default=3600, help="time limit (in seconds)")
     parser.add_argument("--memorylimit", type=float, default=8, help="memory limit (in GB)")
-    args = parser.parse_args()
+    parser.add_argument("--heuristic-roots", type=int, default=0,
+                        help=f"number of roots for the k-tree start heuristic, e.g. {DEFAULT_ROOTS} (default: 0, no heuristics)")
+    parser.add_argument("--reduction", action=argparse.BooleanOptionalAction, default=False,
+                        help="remove nodes and edges that cannot be part of an optimal k-tree before building the model")
+    parser.add_argument("--lagrangian", action=argparse.BooleanOptionalAction, default=False,
+                        help="compute a Lagrangian bound and fix nodes and edges by reduced costs before building the model")
+    parser.add_argument("--cut-rounds", type=int, default=0,
+                        help="rounds of GSEC/DCC user cuts per node for the compact formulations (0 disables the cut loop)")
+    parser.add_argument("--cut-nodes", type=int, default=CUT_NODES,
+                        help="separate user cuts at the root and this many further branch-and-bound nodes")
+    parser.add_argument("--cut-violation", type=float, default=CUT_VIOLATION,
+                        help="minimum violation of a user cut")
+    parser.add_argument("--decompose", action="store_true",
+                        help="solve one subproblem per fixed root node in parallel processes (see decomposition.py)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="number of worker processes of --decompose (each uses --threads threads)")
+    parser.add_argument("--race-formulations", nargs="+", default=RACE_FORMULATIONS, choices=FORMULATIONS,
+                        help="formulations of --formulation race, one worker process each")
+    return parser
 
 
-    inst = Path(args.instance).stem
-    model_name = f"{inst}_{args.k}_{args.formulation}"
+def configure_model(model: gp.Model, args: argparse.Namespace):
+    if not model.IsMIP:
+        sys.exit(f"Error: Your formulation for '{args.formulation}' is not a (mixed) integer linear program.")
+    if model.IsQP or model.IsQCP:
+        sys.exit(f"Error: Your formulation for '{args.formulation}' is non-linear.")
 
-    G: nx.Graph = read_instance(args.instance)
-    # hint: use a directed graph in your formulations! add an artificial root node!
+    # write model to file in readable format (useful for debugging)
+    # model.write("model.lp")
 
-    # context handlers take care of disposing resources correctly
-    with gp.Model(model_name) as model:
-        model._original_graph = G
-        model._k = args.k
-        model._formulation = args.formulation
+    # set thread, time and memory limit
+    if args.threads:
+        model.Params.Threads = args.threads
+    if args.timelimit:
+        model.Params.TimeLimit = args.timelimit
+    if args.memorylimit:
+        model.Params.SoftMemLimit = args.memorylimit
 
-        create_model(model)
-        model.update()
-
-        if not model.IsMIP:
-            sys.exit(f"Error: Your formulation for '{args.formulation}' is not a (mixed) integer linear program.")
-        if model.IsQP or model.IsQCP:
-            sys.exit(f"Error: Your formulation for '{args.formulation}' is non-linear.")
-
-        # write model to file in readable format (useful for debugging)
-        # model.write("model.lp")
-
-        # set thread, time and memory limit
-        if args.threads:
-            model.Params.Threads = args.threads
-        if args.timelimit:
-            model.Params.TimeLimit = args.timelimit
-        if args.memorylimit:
-            model.Params.SoftMemLimit = args.memorylimit
-
-        # tell Gurobi that the model is not complete for CEC and DCC formulations (needs to be considered in presolving)
-        if args.formulation in {"cec", "dcc"}:
-            model.Params.LazyConstraints = 1
-
-        # some parameters to control Gurobi's output and other aspects in the solution process
-        # feel free to change them / add new ones as you see fit
-        # (see https://docs.gurobi.com/projects/optimizer/en/current/concepts/parameters.html)
-        # model.Params.OutputFlag = 0
-        # model.Params.MIPFocus = 2
-
-        if args.formulation in {"cec", "dcc"}:
-            model.optimize(lazy_constraint_callback)
-        else:
-            model.optimize()
+    # tell Gurobi that the model is not complete for CEC, DCC and lazy MCF formulations (needs to be considered in presolving)
+    if args.formulation in LAZY_FORMULATIONS:
+        model.Params.LazyConstraints = 1
+    # user cuts are stated over the original variables, so presolve has to keep them translatable
+    elif args.cut_rounds > 0:
+        model.Params.PreCrush = 1
 
-        model.printStats()
+    # some parameters to control Gurobi's output and other aspects in the solution process
+    # feel free to change them / add new ones as you see fit
+    # (see https://docs.gurobi.com/projects/optimizer/en/current/concepts/parameters.html)
+    # model.Params.OutputFlag = 0
+    # model.Params.MIPFocus = 2
 
 
-        # check solution feasibility
-        is_valid = False
-        selected_edges = set(get_selected_edge_ids(model))
-        k_mst = G.edge_subgraph(edge for edge in G.edges if G.edges[edge]["id"] in selected_edges)
-        if not nx.is_tree(k_mst):
-            print("Error: the provided solution is not a tree!")
-            print(f"{k_mst.number_of_nodes()=}")
-            print(f"{k_mst.number_of_edges()=}")
-            print(f"{nx.is_tree(k_mst)=}")
-            print(f"{nx.number_connected_components(k_mst)=}")
-        else:
-            print("k-MST is valid")
-            is_valid = True
-            
+def optimize(model: gp.Model):
+    if model._formulation in LAZY_FORMULATIONS or model._heuristic or model._cut_rounds > 0:
+        model.optimize(lazy_constraint_callback)
+    else:
+        model.optimize()
 
-        # print statistics
-        results = {
-            "instance": args.instance[-7:],
-            "k": args.k,
-            "formulation": args.formulation,
-            "status": model.Status,
-            "objective_value": model.ObjVal,
-            "best_bound": model.ObjBound,
-            "gap": round(model.MIPGap, 4),
-            "runtime": round(model.runtime, 3),
-            "n_nodes": round(model.NodeCount),
-            "is_valid_k_mst": is_valid
-        }
+    model.printStats()
 
 
-        # Add lazy constraint count to results if applicable
-        lazy_count = 0
-        if args.formulation in {"cec", "dcc"} and hasattr(model, '_lazy_constrs_added'):
-            lazy_count = model._lazy_constrs_added
+def check_k_tree(G: Graph, selected_edge_ids: list[int], k: int, profile: Profile) -> bool:
+    # check solution feasibility: k-1 edges without a cycle in one component (or a single node for k = 1)
+    with profile.phase("validation"):
+        n_tree_nodes, n_components, is_acyclic = G.forest_stats(G.edge_index(selected_edge_ids))
+    if not (is_acyclic and len(selected_edge_ids) == k - 1 and n_components <= 1):
+        print("Error: the provided solution is not a tree!")
+        print(f"{n_tree_nodes=}")
+        print(f"{len(selected_edge_ids)=}")
+        print(f"{is_acyclic=}")
+        print(f"{n_components=}")
+        return False
+    print("k-MST is valid")
+    return True
 
-        results["n_lazy_constraints"] = lazy_count # Add the count
 
+def model_counters(model: gp.Model) -> dict:
+    """The COUNTERS of a solved model."""
+    # Add lazy constraint count to results if applicable
+    lazy_count = 0
+    if model._formulation in LAZY_FORMULATIONS and hasattr(model, '_lazy_constrs_added'):
+        lazy_count = model._lazy_constrs_added
 
+    return {"n_lazy_constraints": lazy_count, "n_user_cuts": model._user_cuts_added, "n_pool_hits": model._cut_pool.hits,
+            "n_pool_misses": model._cut_pool.misses, "n_pool_duplicates": model._cut_pool.duplicates}
 
 
-        
-        print(results)
-        if args.results_file:
-            with open(args.results_file, "w", encoding="utf-8") as f:
-                json.dump(results, f)
+def build_results(args: argparse.Namespace, G: Graph, k: int, formulation: str, status: int, objective: float,
+                  bound: float, runtime: float, n_nodes: int, edge_ids: list[int] | None, tree: KTree | None,
+                  lagrangian: LagrangianBound | None, n_removed_nodes: int, n_removed_edges: int, counters: dict,
+                  profile: Profile, gap: float | None = None, wall_time: float | None = None) -> dict:
+    """Checks the solution edge_ids against G and returns the results of the run.
+
+    The results of solve, solve_sweep, the race and the decomposition all come from here.
+    runtime is Gurobi's time only; wall_time (by default the phase times of the profile)
+    adds reading and preprocessing the instance. The bound is raised to the Lagrangian
+    bound, the gap is computed from it unless given (as Gurobi's MIPGap).
+    """
+    is_valid = edge_ids is not None and check_k_tree(G, edge_ids, k, profile)
+    if lagrangian is not None:
+        bound = max(bound, lagrangian.bound)
+    if gap is None:
+        gap = abs(objective - bound) / abs(objective) if 0 < abs(objective) < math.inf else 0.0
+
+    # print statistics
+    results = {
+        "instance": args.instance[-7:],
+        "k": k,
+        "formulation": formulation,
+        "status": status,
+        "objective_value": objective,
+        "best_bound": bound,
+        "lagrangian_bound": lagrangian.bound if lagrangian is not None else None,
+        "gap": round(gap, 4),
+        "runtime": round(runtime, 3),
+        "wall_time": round(sum(profile.phases.values()) if wall_time is None else wall_time, 3),
+        "n_nodes": n_nodes,
+        "heuristic_objective": tree.cost if tree is not None else None,
+        "n_removed_nodes": n_removed_nodes,
+        "n_removed_edges": n_removed_edges,
+        "is_valid_k_mst": is_valid
+    }
+    results.update(counters)
+
+    # phase times and separator statistics, see profiling.py
+    results.update(profile.results())
+
+    print(results)
+    return results
+
+
+def collect_results(model: gp.Model, args: argparse.Namespace, G: Graph, tree: KTree | None,
+                    lagrangian: LagrangianBound | None, n_removed_nodes: int, n_removed_edges: int,
+                    profile: Profile) -> dict:
+    """The results of the run of a solved model, see build_results."""
+    return build_results(args, G, model._k, args.formulation, model.Status, model.ObjVal, model.ObjBound, model.Runtime,
+                         round(model.NodeCount), get_selected_edge_ids(model), tree, lagrangian, n_removed_nodes,
+                         n_removed_edges, model_counters(model), profile, gap=model.MIPGap)
+
+
+def preprocess(G: Graph, args: argparse.Namespace, profile: Profile) -> tuple[KTree | None, LagrangianBound | None, Graph]:
+    """The start k-tree, the Lagrangian bound and the reduced graph H of G for the k of args (the tree refers to H)."""
+    # greedy k-tree as MIP start and upper bound for the reduction, the callback adds LP-guided trees during the search
+    with profile.phase("heuristic"):
+        tree = construct_k_tree(G, args.k, args.heuristic_roots) if args.heuristic_roots > 0 else None
+
+    upper_bound = tree.cost if tree is not None else math.inf
+
+    # the reduced graph keeps the edge ids, so solutions are still reported in terms of G
+    H = G
+    if args.reduction:
+        with profile.phase("reduction"):
+            H = reduce_graph(G, args.k, upper_bound)
+
+    # the Lagrangian bound fixes further nodes and edges by reduced costs and is a fallback bound at the time limit
+    with profile.phase("lagrangian"):
+        lagrangian = solve_lagrangian(H, args.k, upper_bound) if args.lagrangian else None
+    if lagrangian is not None:
+        print(f"Lagrangian bound {lagrangian.bound:.2f} after {lagrangian.iterations} iterations ({lagrangian.runtime:.3f}s), "
+              f"fixed {lagrangian.fixed_nodes.sum()} nodes and {lagrangian.fixed_edges.sum()} edges")
+        H = H.subgraph(~lagrangian.fixed_nodes, ~lagrangian.fixed_edges)
+        if args.reduction:
+            with profile.phase("reduction"):
+                H = reduce_graph(H, args.k, upper_bound)
+
+    if H is not G:
+        print(f"Reduction removed {G.n - H.n} of {G.n} nodes and {G.m - H.m} of {G.m} edges")
+        if tree is not None:
+            tree = transfer_tree(tree, G, H)
+
+    return tree, lagrangian, H
+
+
+def solve(G: Graph, args: argparse.Namespace, env: gp.Env | None = None, profile: Profile | None = None) -> dict:
+    """Solves the k-MST instance G with the options of the command line arguments and returns the results.
+
+    The optional Gurobi environment is shared between solves by the in-process benchmark runner.
+    A profile passed in may already hold the time of reading the instance.
+    """
+    # the race and the decomposition run their models in worker processes
+    if args.formulation == "race":
+        from race import solve_race
+        return solve_race(G, args, profile)
+    if args.decompose:
+        from decomposition import solve_decomposed
+        return solve_decomposed(G, args, profile)
+
+    profile = profile or Profile()
+    inst = Path(args.instance).stem
+    model_name = f"{inst}_{args.k}_{args.formulation}"
+
+    # hint: use a directed graph in your formulations! add an artificial root node!
+    tree, lagrangian, H = preprocess(G, args, profile)
+
+    # context handlers take care of disposing resources correctly
+    with gp.Model(model_name, env=env) as model:
+        model._original_graph = H
+        model._k = args.k
+        model._formulation = args.formulation
+        model._heuristic = args.heuristic_roots > 0
+        model._cut_rounds, model._cut_nodes, model._cut_violation = args.cut_rounds, args.cut_nodes, args.cut_violation
+
+        with profile.phase("create_model"):
+            create_model(model)
+        model._profile = profile
+        with profile.phase("update"):
+            model.update()
+
+        if tree is not None:
+            set_start(model, tree)
+
+        configure_model(model, args)
+        with profile.phase("optimize"):
+            optimize(model)
+
+        results = collect_results(model, args, G, tree, lagrangian, G.n - H.n, G.m - H.m, profile)
 
         if args.solution_file:
             write_solution(args.solution_file, get_selected_edge_ids(model))
-            pass
 
         # # Stuff I added
         # for v in model.getVars():
         #     if v.X > 0:
         #         print(f"{v.VarName} = {v.X}")
         
-        #plot_graph(model, G)
\ No newline at end of file
+        # pyvis is slow to import, so visuals is only imported for plotting
+        # from visuals import plot_graph
+        #plot_graph(model, G)
+
+    return results
+
+
+def sweep_solution_file(solution_file: str, k: int) -> str:
+    path = Path(solution_file)
+    return str(path.with_name(f"{path.stem}_k{k}{path.suffix}"))
+
+
+def sweep_arguments(args: argparse.Namespace, k: int) -> argparse.Namespace:
+    """The options of one k of a sweep, with the solution file of that k."""
+    solution_file = sweep_solution_file(args.solution_file, k) if args.solution_file else None
+    return argparse.Namespace(**{**vars(args), "k": k, "solution_file": solution_file})
+
+
+def solve_sweep(G: Graph, args: argparse.Namespace, ks: list[int], env: gp.Env | None = None,
+                profile: Profile | None = None) -> list[dict]:
+    """Solves the instance for several k with one model and returns the results per k.
+
+    The model is built once on the graph reduced for the smallest k; for every k it is
+    updated in place (see model.update_k), nodes and edges removed by the reduction and
+    the Lagrangian fixing are fixed to zero by their bounds, the cuts pooled in the
+    earlier solves are added as lazy constraints and the previous optimal tree, resized
+    to k, is the MIP start if it beats the greedy one. Every k gets its own profile, the
+    time of reading and building the model is reported with the first k.
+    """
+    # the race and the decomposition build new models for every solve, so they solve every k on its own
+    if args.formulation == "race" or args.decompose:
+        return [solve(G, sweep_arguments(args, k), env, profile if i == 0 else None) for i, k in enumerate(ks)]
+
+    profile = profile or Profile()
+    inst = Path(args.instance).stem
+    model_name = f"{inst}_{ks[0]}-{ks[-1]}_{args.formulation}"
+
+    # only the component test applies to all k, the bound test depends on the tree of each k
+    with profile.phase("reduction"):
+        H = reduce_graph(G, min(ks)) if args.reduction else G
+    results = []
+
+    with gp.Model(model_name, env=env) as model:
+        model._original_graph = H
+        model._k = ks[0]
+        model._formulation = args.formulation
+        model._heuristic = args.heuristic_roots > 0
+        model._cut_rounds, model._cut_nodes, model._cut_violation = args.cut_rounds, args.cut_nodes, args.cut_violation
+
+        with profile.phase("create_model"):
+            create_model(model)
+        with profile.phase("update"):
+            model.update()
+        configure_model(model, args)
+
+        previous = None
+        for k in ks:
+            print(f"Solving k = {k}")
+            model._profile = profile
+            model._lazy_constrs_added = model._user_cuts_added = model._heuristic_calls = 0
+            model._cut_node = -1
+            model._selected_edges = None
+            model._cut_pool.hits = model._cut_pool.misses = model._cut_pool.duplicates = 0
+
+            with profile.phase("heuristic"):
+                tree = construct_k_tree(H, k, args.heuristic_roots) if args.heuristic_roots > 0 else None
+                if previous is not None:
+                    resized = resize_k_tree(H, previous, k)
+                    if resized is not None and (tree is None or resized.cost < tree.cost):
+                        tree = resized
+            upper_bound = tree.cost if tree is not None else math.inf
+
+            # the reductions of solve, applied as bounds on the variables of H
+            with profile.phase("reduction"):
+                R = reduce_graph(H, k, upper_bound) if args.reduction else H
+            with profile.phase("lagrangian"):
+                lagrangian = solve_lagrangian(R, k, upper_bound) if args.lagrangian else None
+            fixed_nodes = np.ones(H.n, dtype=bool)
+            fixed_edges = np.ones(H.m, dtype=bool)
+            fixed_nodes[H.node_index(R.labels)] = False
+            fixed_edges[H.edge_index(R.ids)] = False
+            if lagrangian is not None:
+                fixed_nodes[H.node_index(R.labels[lagrangian.fixed_nodes])] = True
+                fixed_edges[H.edge_index(R.ids[lagrangian.fixed_edges])] = True
+            with profile.phase("update"):
+                update_k(model, k)
+                fix_variables(model, fixed_nodes, fixed_edges)
+                add_pool_constraints(model)
+                if tree is not None:
+                    set_start(model, tree)
+
+            with profile.phase("optimize"):
+                optimize(model)
+
+            n_removed_nodes = G.n - H.n + int(fixed_nodes.sum())
+            n_removed_edges = G.m - H.m + int(fixed_edges.sum())
+            results.append(collect_results(model, args, G, tree, lagrangian, n_removed_nodes, n_removed_edges, profile))
+            profile = Profile()
+
+            if args.solution_file:
+                write_solution(sweep_solution_file(args.solution_file, k), get_selected_edge_ids(model))
+
+            if model.SolCount > 0:
+                previous = get_solution_tree(model)
+
+    return results
+
+
+def main():
+    # "kmst.py serve" runs the solver daemon, see server.py
+    if sys.argv[1:2] == ["serve"]:
+        from server import main as serve
+        serve(sys.argv[2:])
+        return
+
+    # parse command line arguments
+    args = build_parser().parse_args()
+    if args.decompose and args.formulation == "race":
+        sys.exit("Error: --decompose cannot be combined with --formulation race.")
+
+    profile = Profile()
+    with profile.phase("read"):
+        G = Graph.read(args.instance)
+    if isinstance(args.k, list):
+        results = solve_sweep(G, args, args.k, profile=profile)
+    else:
+        results = solve(G, args, profile=profile)
+
+    if args.results_file:
+        with open(args.results_file, "w", encoding="utf-8") as f:
+            json.dump(results, f)
+
+
+if __name__ == "__main__":
+    main()
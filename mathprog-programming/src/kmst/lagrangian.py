@@ -0,0 +1,127 @@
+import math
+import time
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse import csgraph
+
+from graph import Graph
+
+# subgradient iterations and the number of iterations without improvement before the step is halved
+MAX_ITERATIONS = 300
+STALL_ITERATIONS = 20
+
+
+class LagrangianBound:
+    """Result of the Lagrangian dual: the best bound and the node/edge positions it fixes to zero."""
+
+    __slots__ = ("bound", "fixed_nodes", "fixed_edges", "iterations", "runtime")
+
+    def __init__(self, bound: float, fixed_nodes: np.ndarray, fixed_edges: np.ndarray, iterations: int, runtime: float):
+        self.bound = float(bound)
+        self.fixed_nodes = fixed_nodes
+        self.fixed_edges = fixed_edges
+        self.iterations = iterations
+        self.runtime = runtime
+
+
+class Subproblem:
+    """Relaxation of k-MST without the linking constraints z_e <= x_i, z_e <= x_j of the edges e = (i,j).
+
+    With multipliers l_ei, l_ej >= 0 it decomposes into the cheapest forest with k-1 edges
+    on the costs c_e + l_ei + l_ej, which are the k-1 cheapest edges of a minimum spanning
+    forest (Kruskal stopped early), and the k nodes with the largest prizes sum_e l_ev.
+    """
+
+    def __init__(self, n: int, tail: np.ndarray, head: np.ndarray, cost: np.ndarray, k: int):
+        self.n, self.tail, self.head, self.cost, self.k = n, tail, head, cost, k
+        # minimum_spanning_tree returns its edges as (row < col) pairs, edges are found by this key
+        key = np.minimum(tail, head) * n + np.maximum(tail, head)
+        self.key_order = np.argsort(key)
+        self.sorted_key = key[self.key_order]
+
+    def solve(self, l_tail: np.ndarray, l_head: np.ndarray):
+        """Optimal (edges, nodes, value, reduced edge costs, prizes) for the multipliers, None if there is no forest with k-1 edges."""
+        n, k = self.n, self.k
+        reduced = self.cost + l_tail + l_head
+        prize = np.bincount(self.tail, l_tail, minlength=n) + np.bincount(self.head, l_head, minlength=n)
+
+        # shift the costs, minimum_spanning_tree ignores edges of weight zero
+        shift = 1 - min(reduced.min(), 0)
+        forest = csgraph.minimum_spanning_tree(sp.coo_array((reduced + shift, (self.tail, self.head)), shape=(n, n)).tocsr()).tocoo()
+        if forest.nnz < k - 1:
+            return None
+        key = np.minimum(forest.row, forest.col).astype(np.int64) * n + np.maximum(forest.row, forest.col)
+        forest_edges = self.key_order[np.searchsorted(self.sorted_key, key)]
+        edges = forest_edges[np.argsort(reduced[forest_edges], kind="stable")[:k - 1]]
+
+        nodes = np.argpartition(-prize, k - 1)[:k]
+        value = reduced[edges].sum() - prize[nodes].sum()
+        return edges, nodes, value, reduced, prize
+
+
+def solve_lagrangian(G: Graph, k: int, upper_bound: float = math.inf, max_iterations: int = MAX_ITERATIONS,
+                     time_limit: float = math.inf, tol: float = 1e-6) -> LagrangianBound | None:
+    """Subgradient optimization of the Lagrangian dual and reduced-cost fixing at the best multipliers.
+
+    The step size follows Polyak's rule towards upper_bound (or an estimate if it is not
+    finite). An edge e outside the subproblem forest can only be forced in by replacing
+    its most expensive edge, so every k-tree containing e costs at least
+    L + c~_e - c~_max; similarly a node v outside the chosen nodes costs at least
+    L + p_min - p_v. Edges and nodes whose bound exceeds upper_bound cannot be in an
+    optimal k-tree. Returns None if G has no forest with k-1 edges (k-MST is infeasible).
+    """
+    start_time = time.perf_counter()
+    n, m, tail, head, cost = G.n, G.m, G.tail, G.head, G.cost
+    if k < 2:
+        return LagrangianBound(0.0, np.zeros(n, dtype=bool), np.zeros(m, dtype=bool), 0, 0.0)
+
+    subproblem = Subproblem(n, tail, head, cost, k)
+    l_tail, l_head = np.zeros(m), np.zeros(m)
+    best, best_solution = -math.inf, None
+    step, stall = 2.0, 0
+
+    iteration = 0
+    while iteration < max_iterations and time.perf_counter() - start_time < time_limit:
+        iteration += 1
+        solution = subproblem.solve(l_tail, l_head)
+        if solution is None:
+            return None
+        edges, chosen, value, _, _ = solution
+
+        if value > best + tol:
+            best, best_solution, stall = value, solution, 0
+        else:
+            stall += 1
+            if stall >= STALL_ITERATIONS:
+                step, stall = step / 2, 0
+        if best > upper_bound - tol or step < 1e-4:
+            break
+
+        # subgradients z_e - x_i and z_e - x_j of the relaxed constraints
+        z, x = np.zeros(m), np.zeros(n)
+        z[edges] = 1
+        x[chosen] = 1
+        g_tail, g_head = z - x[tail], z - x[head]
+        norm = (g_tail @ g_tail) + (g_head @ g_head)
+        if norm == 0:
+            break
+
+        target = upper_bound if math.isfinite(upper_bound) else best + 0.05 * abs(best) + 1
+        t = step * (target - value) / norm
+        l_tail = np.maximum(l_tail + t * g_tail, 0)
+        l_head = np.maximum(l_head + t * g_head, 0)
+
+    edges, chosen, value, reduced, prize = best_solution
+    fixed_edges = np.zeros(m, dtype=bool)
+    fixed_nodes = np.zeros(n, dtype=bool)
+    if math.isfinite(upper_bound):
+        in_forest = np.zeros(m, dtype=bool)
+        in_forest[edges] = True
+        in_chosen = np.zeros(n, dtype=bool)
+        in_chosen[chosen] = True
+        if len(edges):
+            fixed_edges = ~in_forest & (value + reduced - reduced[edges].max() > upper_bound + tol)
+        fixed_nodes = ~in_chosen & (value + prize[chosen].min() - prize > upper_bound + tol)
+
+    return LagrangianBound(value, fixed_nodes, fixed_edges, iteration, time.perf_counter() - start_time)
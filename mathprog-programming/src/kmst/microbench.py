@@ -0,0 +1,317 @@
+# microbench.py
+
+import argparse
+import gc
+import json
+import math
+import sys
+import time
+from pathlib import Path
+
+import gurobipy as gp
+from gurobipy import GRB
+import numpy as np
+
+from cutpool import CutPool
+from generator import generate, write_dat
+from graph import Graph
+from kmst import BENCHMARK_FORMULATIONS, FORMULATIONS
+from model import add_violated_cec_frac, add_violated_cec_int, add_violated_dcc, create_model, lazy_constraint_callback
+from util import parse_instance
+
+DATA_DIR_DEFAULT = "mathprog-programming/data"
+BENCH_DIR_DEFAULT = "mathprog-programming/benchmarks"
+# generated instances (family, nodes, edges, seed) in addition to g01-g10
+GENERATED = [("random", 60, 240, 1), ("geometric", 60, 240, 1), ("scale-free", 60, 240, 1),
+             ("random", 150, 900, 2), ("random", 3000, 30000, 3), ("geometric", 3000, 30000, 3)]
+# the full MCF model has |A| * |V| flow variables, larger models are not built
+MAX_MCF_SIZE = 10**5
+# node relaxations and integer solutions recorded per instance and formulation
+MAX_RECORDED_POINTS = 10
+# instances with separator cases; recording the larger ones needs a license beyond the size-limited one
+RECORDED_INSTANCES = ["g01", "g02", "g03", "g04", "g05", "random60_240_1", "geometric60_240_1", "scale-free60_240_1"]
+# separators per recorded formulation as (case name, kind of recorded points, separator)
+SEPARATORS = {"cec": [("cec_int", "sol", add_violated_cec_int), ("cec_frac", "node", add_violated_cec_frac)],
+              "dcc": [("dcc", "node", add_violated_dcc), ("dcc_int", "sol", add_violated_dcc)]}
+REPEAT = 5
+# cases that look slower are measured again with this many times the repeats before they count as regressions
+CONFIRM_FACTOR = 4
+# a case fails if it is this much slower than its baseline (relative) and by at least MIN_SLOWDOWN seconds
+THRESHOLD = 0.25
+MIN_SLOWDOWN = 0.001
+
+
+def instance_files(data_dir: Path, bench_dir: Path) -> list[Path]:
+    """The instances of data_dir and the generated ones (written on first use)."""
+    files = sorted(data_dir.glob("g*.dat"))
+    generated_dir = bench_dir / "generated"
+    generated_dir.mkdir(parents=True, exist_ok=True)
+    for family, n_nodes, n_edges, seed in GENERATED:
+        path = generated_dir / f"{family}{n_nodes}_{n_edges}_{seed}.dat"
+        if not path.exists():
+            write_dat(str(path), n_nodes, *generate(family, n_nodes, n_edges, seed))
+        files.append(path)
+    return files
+
+
+def benchmark_k(G: Graph) -> int:
+    # the smaller k of the benchmark runs, see benchmarking.calculate_k_values
+    return max(1, math.ceil(G.n / 5))
+
+
+def build(G: Graph, formulation: str, env: gp.Env, k: int | None = None) -> gp.Model:
+    model = gp.Model(env=env)
+    model._original_graph = G
+    model._k = benchmark_k(G) if k is None else k
+    model._formulation = formulation
+    model._heuristic = False
+    create_model(model)
+    model.update()
+    return model
+
+
+def measure(func, repeat: int) -> float:
+    """Fastest of repeat runs, which is the least disturbed by other load on the machine.
+
+    As in timeit, the garbage collector is disabled while timing, so collections caused by
+    earlier cases do not land in a run.
+    """
+    best = math.inf
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return best
+
+
+class RecordedNode:
+    """The state a separator reads from the model in a callback, for a recorded solution.
+
+    cbLazy only collects the cut expressions, so separators run without an optimization
+    (and without a license for the size of the model).
+    """
+
+    def __init__(self, model: gp.Model):
+        for name in ("_tail", "_head", "_arc_index", "_cut_vars", "_formulation"):
+            setattr(self, name, getattr(model, name))
+        self._arc_csr = getattr(model, "_arc_csr", None)
+        self._flow_network = getattr(model, "_flow_network", None)
+        self._n_values = model._cut_pool.n_values
+        self.reset()
+
+    def reset(self):
+        self._cut_pool = CutPool(self._n_values)
+        self._lazy_constrs_added = self._user_cuts_added = 0
+        self._user_cuts = False
+        self.lazy = []
+
+    def set_values(self, y: np.ndarray, x: np.ndarray, r: np.ndarray):
+        self._y_values, self._x_values, self._r_value = y, x, r
+
+    def cbLazy(self, constr):
+        self.lazy.append(constr)
+
+
+def recording_path(bench_dir: Path, instance: Path, formulation: str) -> Path:
+    return bench_dir / "recordings" / f"{instance.stem}_{formulation}.npz"
+
+
+def record(instance: Path, formulation: str, bench_dir: Path, env: gp.Env):
+    """Solve with the lazy constraint callback and save the first node relaxations and integer solutions it sees.
+
+    Presolve, heuristics and Gurobi's cuts are off, so the search reaches node relaxations
+    even on instances the root solve would otherwise finish; every cut round of the root
+    is recorded as a node relaxation.
+    """
+    G = Graph.read(str(instance))
+    points = {"node": [], "sol": []}
+
+    def callback(model, where):
+        if where == GRB.Callback.MIPSOL and len(points["sol"]) < MAX_RECORDED_POINTS:
+            r = model.cbGetSolution(model._r) if model._r is not None else np.zeros(0)
+            points["sol"].append((model.cbGetSolution(model._y), model.cbGetSolution(model._x), r))
+        elif (where == GRB.Callback.MIPNODE and model.cbGet(GRB.Callback.MIPNODE_STATUS) == GRB.OPTIMAL
+              and len(points["node"]) < MAX_RECORDED_POINTS):
+            r = model.cbGetNodeRel(model._r) if model._r is not None else np.zeros(0)
+            points["node"].append((model.cbGetNodeRel(model._y), model.cbGetNodeRel(model._x), r))
+        lazy_constraint_callback(model, where)
+        if min(len(p) for p in points.values()) >= MAX_RECORDED_POINTS:
+            model.terminate()
+
+    with build(G, formulation, env) as model:
+        sizes = {"y": len(model._tail), "x": G.n, "r": G.n if model._r is not None else 0}
+        model.Params.LazyConstraints = 1
+        model.Params.Threads = 1
+        model.Params.TimeLimit = 60
+        model.Params.Presolve = 0
+        model.Params.Heuristics = 0
+        model.Params.Cuts = 0
+        try:
+            model.optimize(callback)
+        except gp.GurobiError as e:
+            print(f"  Skipping recording {instance.stem} {formulation}: {e}")
+            return
+
+    arrays = {"k": benchmark_k(G)}
+    for kind, values in points.items():
+        for i, name in enumerate(("y", "x", "r")):
+            arrays[f"{kind}_{name}"] = np.array([point[i] for point in values]).reshape(len(values), sizes[name])
+    path = recording_path(bench_dir, instance, formulation)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(path, **arrays)
+    print(f"  Recorded {len(points['node'])} node relaxations and {len(points['sol'])} solutions to {path}")
+    if not all(points.values()):
+        print(f"  Warning: the recording of {instance.stem} {formulation} misses node relaxations or solutions")
+
+
+def separation_cases(instance: Path, G: Graph, bench_dir: Path, env: gp.Env) -> dict:
+    """Per separator a case that runs it on all recorded points of the instance (one of RECORDED_INSTANCES).
+
+    A separator whose recording is missing or has no points of its kind gets None instead
+    of a case, main reports it as a failure.
+    """
+    cases = {}
+    for formulation, runs in SEPARATORS.items():
+        path = recording_path(bench_dir, instance, formulation)
+        if not path.exists():
+            cases.update({f"separate/{instance.stem}/{name}": None for name, _, _ in runs})
+            continue
+        with np.load(path) as recorded:
+            recorded = dict(recorded)
+        with build(G, formulation, env, int(recorded["k"])) as model:
+            node = RecordedNode(model)
+        for name, kind, separator in runs:
+            points = list(zip(recorded[f"{kind}_y"], recorded[f"{kind}_x"], recorded[f"{kind}_r"]))
+            if not points:
+                cases[f"separate/{instance.stem}/{name}"] = None
+                continue
+
+            def run(node=node, points=points, separator=separator):
+                node.reset()
+                for y, x, r in points:
+                    node.set_values(y, x, r)
+                    separator(node)
+
+            cases[f"separate/{instance.stem}/{name}"] = run
+    return cases
+
+
+def collect_cases(instances: list[Path], formulations: list[str], bench_dir: Path, env: gp.Env,
+                  pattern: str | None = None) -> dict:
+    """The benchmark cases by name, each a function that runs it once (None for separators without recorded points)."""
+    cases = {}
+    for instance in instances:
+        filename = str(instance)
+        cases[f"parse/{instance.stem}"] = lambda filename=filename: parse_instance(filename)
+        G = Graph.read(filename)  # writes the sidecar, so the cached read is timed
+        cases[f"read/{instance.stem}"] = lambda filename=filename: Graph.read(filename)
+
+        for formulation in formulations:
+            if formulation == "mcf" and 2 * G.m * G.n > MAX_MCF_SIZE:
+                continue
+            cases[f"create_model/{instance.stem}/{formulation}"] = \
+                lambda G=G, formulation=formulation: build(G, formulation, env).dispose()
+
+        if instance.stem in RECORDED_INSTANCES:
+            cases.update(separation_cases(instance, G, bench_dir, env))
+    return {name: run for name, run in cases.items() if pattern is None or pattern in name}
+
+
+def run_cases(cases: dict, repeat: int) -> dict[str, float]:
+    times = {}
+    for name, run in cases.items():
+        times[name] = measure(run, repeat)
+        print(f"  {name}: {times[name] * 1000:.2f} ms")
+    return times
+
+
+def compare(times: dict[str, float], baseline: dict[str, float], threshold: float) -> list[str]:
+    """Cases that got slower than their baseline by more than the threshold."""
+    return [name for name, seconds in sorted(times.items())
+            if name in baseline and seconds > baseline[name] * (1 + threshold) and seconds - baseline[name] > MIN_SLOWDOWN]
+
+
+def report_missing(missing: list[str]) -> bool:
+    """Prints the separator cases that could not run (see separation_cases), returns whether there were any."""
+    if missing:
+        print(f"{len(missing)} separator cases have no recorded points (re-record them with --record):")
+        for name in missing:
+            print(f"  {name}")
+    return bool(missing)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of instance reading, model building and separation")
+    parser.add_argument("--data-dir", type=str, default=DATA_DIR_DEFAULT, help="directory with the g*.dat instances")
+    parser.add_argument("--bench-dir", type=str, default=BENCH_DIR_DEFAULT,
+                        help="directory of the baseline, the recorded LP solutions and the generated instances")
+    parser.add_argument("--formulations", nargs="+", default=BENCHMARK_FORMULATIONS, choices=FORMULATIONS)
+    parser.add_argument("--filter", type=str, help="only run cases whose name contains this string")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="runs per case, the fastest one counts")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="allowed relative slowdown against the baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="store the measured times as the new baseline")
+    parser.add_argument("--record", action="store_true",
+                        help="record LP solutions for the separator cases first (needs a license for the model sizes)")
+    args = parser.parse_args()
+
+    bench_dir = Path(args.bench_dir)
+    instances = instance_files(Path(args.data_dir), bench_dir)
+
+    env = gp.Env(empty=True)
+    env.setParam("OutputFlag", 0)
+    env.start()
+
+    if args.record:
+        for instance in instances:
+            if instance.stem not in RECORDED_INSTANCES:
+                continue
+            for formulation in SEPARATORS:
+                record(instance, formulation, bench_dir, env)
+
+    cases = collect_cases(instances, args.formulations, bench_dir, env, args.filter)
+    missing = [name for name, run in cases.items() if run is None]
+    cases = {name: run for name, run in cases.items() if run is not None}
+    times = run_cases(cases, args.repeat)
+
+    baseline_path = bench_dir / "baseline.json"
+    if args.save_baseline:
+        baseline = json.loads(baseline_path.read_text(encoding="utf-8")) if baseline_path.exists() else {}
+        baseline.update(times)
+        baseline_path.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"Saved {len(times)} cases to {baseline_path}")
+        if report_missing(missing):
+            sys.exit(1)
+        return
+
+    if not baseline_path.exists():
+        print(f"No baseline at {baseline_path}, run with --save-baseline first")
+        if report_missing(missing):
+            sys.exit(1)
+        return
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    # separator cases of the baseline whose recording is gone count as missing as well
+    missing += [name for name in sorted(baseline) if name.startswith("separate/") and name not in cases
+                and name not in missing and (args.filter is None or args.filter in name)]
+    suspects = compare(times, baseline, args.threshold)
+    if suspects:
+        # timings are noisy, only slowdowns that persist over more runs count
+        print(f"Measuring {len(suspects)} slower cases again")
+        times.update(run_cases({name: cases[name] for name in suspects}, CONFIRM_FACTOR * args.repeat))
+    regressions = compare(times, baseline, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} cases are more than {100 * args.threshold:.0f}% slower than the baseline:")
+        for name in regressions:
+            print(f"  {name}: {times[name] * 1000:.2f} ms vs. baseline {baseline[name] * 1000:.2f} ms "
+                  f"(+{100 * (times[name] / baseline[name] - 1):.0f}%)")
+    if report_missing(missing) or regressions:
+        sys.exit(1)
+    print(f"All {len(times)} cases within {100 * args.threshold:.0f}% of the baseline")
+
+
+if __name__ == "__main__":
+    main()
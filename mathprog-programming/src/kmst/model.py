@@ -1,6 +1,25 @@
+import time
+
 import gurobipy as gp
 from gurobipy import GRB
-import networkx as nx
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse import csgraph
+
+from cutpool import Cut, CutPool
+from graph import Graph
+from heuristic import KTree, guided_k_tree
+from profiling import Profile
+from util import DisjointSet
+
+# integer scale of the LP values used as max-flow capacities
+FLOW_SCALE = 10**6
+# maximum number of cuts added per separation round
+MAX_CUTS_PER_ROUND = 50
+# maximum number of nested cuts separated for one target
+MAX_NESTED_CUTS = 3
+# the LP-guided primal heuristic runs at every this many-th node relaxation
+HEURISTIC_FREQUENCY = 10
 
 def lazy_constraint_callback(model: gp.Model, where):
     # note: you'll need to account for tolerances!
@@ -13,11 +32,12 @@ def lazy_constraint_callback(model: gp.Model, where):
         model._y_values = model.cbGetSolution(model._y)
 
         if model._formulation == "cec":
-            add_violated_cec_int(model)
-        elif model._formulation == "dcc":
+            model._x_values = model.cbGetSolution(model._x)
+            separate(model, add_violated_cec_int)
+        elif model._formulation in {"dcc", "mcf-lazy"}:
             model._x_values = model.cbGetSolution(model._x)
             model._r_value = model.cbGetSolution(model._r)
-            add_violated_dcc(model)
+            separate(model, add_violated_dcc)
 
     # check fractional solutions to find violated CECs/DCCs to strengthen the bound
     elif where == GRB.Callback.MIPNODE and model.cbGet(GRB.Callback.MIPNODE_STATUS) == GRB.OPTIMAL:
@@ -27,213 +47,664 @@ def lazy_constraint_callback(model: gp.Model, where):
         model._y_values = model.cbGetNodeRel(model._y)
         model._x_values = model.cbGetNodeRel(model._x)
 
+        if model._heuristic:
+            run_heuristic(model)
+
         # you may also use different algorithms for integer and fractional separation if you want
         if model._formulation == "cec":
-            add_violated_cec_frac(model)
-        elif model._formulation == "dcc":
+            separate(model, add_violated_cec_frac)
+        elif model._formulation in {"dcc", "mcf-lazy"}:
             model._r_value = model.cbGetNodeRel(model._r)
-            add_violated_dcc(model)
+            separate(model, add_violated_dcc)
+        elif model._cut_rounds > 0:
+            separate_user_cuts(model)
+
+
+def separate_user_cuts(model: gp.Model):
+    # Cut loop of the compact formulations: GSECs and, for formulations with a root variable, DCCs are
+    # valid for their integer solutions and strengthen the LP relaxation. They are added as user cuts in
+    # at most model._cut_rounds rounds per node, at the root and the first model._cut_nodes nodes (the
+    # callback does not know the depth of a node, the node count is the closest measure of it).
+    node = int(model.cbGet(GRB.Callback.MIPNODE_NODCNT))
+    if node > model._cut_nodes:
+        return
+    if node != model._cut_node:
+        model._cut_node, model._cut_round = node, 0
+    if model._cut_round >= model._cut_rounds:
+        return
+    model._cut_round += 1
+
+    # the separators' graphs are only built if the cut loop runs
+    if model._arc_csr is None:
+        model._arc_csr = build_csr(model._tail, model._head, len(model._x_values))
+    if model._r is None:
+        separators = (add_violated_cec_frac,)
+    else:
+        if model._flow_network is None:
+            model._flow_network = build_flow_network(model._tail, model._head, len(model._x_values))
+        model._r_value = model.cbGetNodeRel(model._r)
+        separators = (add_violated_cec_frac, add_violated_dcc)
+    model._user_cuts = True
+    try:
+        separate(model, *separators)
+    finally:
+        model._user_cuts = False
 
 
-def add_violated_cec_int(model: gp.Model):
-    # Build a graph
-    G = nx.Graph()
-    for (i,j), val in model._y_values.items():
-        if val > 1e-5:
-            G.add_edge(i, j, weight=val)
+def run_heuristic(model: gp.Model):
+    # round the node relaxation to a k-tree by Prim growth on the costs scaled with 1 - y,
+    # and pass it to Gurobi if it improves the incumbent
+    model._heuristic_calls += 1
+    if model._heuristic_calls % HEURISTIC_FREQUENCY != 1:
+        return
 
-    # Detect cycles
-    try:
-        cycle_edges = nx.find_cycle(G)
-    except nx.NetworkXNoCycle:
+    m = len(model._y_values) // 2
+    z = model._y_values[:m] + model._y_values[m:]
+    tree = guided_k_tree(model._original_graph, z, model._x_values, model._k)
+    if tree is None or tree.cost >= model.cbGet(GRB.Callback.MIPNODE_OBJBST) - 1e-6:
+        return
+
+    for var, value in start_values(model, tree):
+        model.cbSetSolution(var.reshape(-1).tolist(), value.ravel().tolist())
+    model.cbUseSolution()
+
+
+def separate(model: gp.Model, *separators):
+    # cuts from earlier rounds are cheap to check, only run the separators if none of them is violated
+    y, x = model._y_values, model._x_values
+    values = np.zeros(model._cut_pool.n_values)
+    values[:len(y)] = y
+    values[len(y):len(y) + len(x)] = x
+    if model._r is not None:
+        values[len(y) + len(x):] = model._r_value
+    model._values = values
+
+    profile = model._profile
+    start, n_cuts = time.perf_counter(), cuts_added(model)
+    pooled = model._cut_pool.violated(values, model._cut_violation if model._user_cuts else 1e-5)
+    if pooled:
+        add_cuts(model, pooled[:MAX_CUTS_PER_ROUND], pooled=True)
+    profile.record_separator("pool", time.perf_counter() - start, cuts_added(model) - n_cuts)
+    if pooled:
         return
 
-    # Add lazy constraint to eliminate this cycle
-    model.cbLazy(gp.quicksum(model._y[i,j] + model._y[j,i] for i,j in cycle_edges) <= len(cycle_edges) - 1)
-    model._lazy_constrs_added += 1
-    pass
+    for separator in separators:
+        start, n_cuts = time.perf_counter(), cuts_added(model)
+        separator(model)
+        profile.record_separator(separator.__name__.removeprefix("add_violated_"), time.perf_counter() - start,
+                                 cuts_added(model) - n_cuts)
+
+
+def cuts_added(model: gp.Model) -> int:
+    return model._lazy_constrs_added + model._user_cuts_added
+
+
+def add_cuts(model: gp.Model, cuts: list[Cut], pooled: bool = False):
+    # cuts index the stacked variables (y, x, r), see create_model
+    for cut in cuts:
+        # user cuts that are violated by less than the threshold hardly move the bound
+        if model._user_cuts and cut.violation(model._values) < model._cut_violation:
+            continue
+        if not pooled and not model._cut_pool.add(cut):
+            continue
+        constr = gp.LinExpr(cut.coef.tolist(), [model._cut_vars[i] for i in cut.index]) >= cut.rhs
+        if model._user_cuts:
+            model.cbCut(constr)
+            model._user_cuts_added += 1
+        else:
+            model.cbLazy(constr)
+            model._lazy_constrs_added += 1
+
+
+def add_violated_cec_int(model: gp.Model):
+    # Components of the selected edges via union-find. A component S with at least |S| edges
+    # contains a cycle and violates the GSEC y(E(S)) <= x(S) - x[j] for any j in S; a
+    # component apart from the largest one violates y(delta(S)) >= x[i] + x[j] - 1 for
+    # i in S and j in the largest component. All of them are added in the same round.
+    tail, head = model._tail, model._head
+    m = len(tail) // 2
+    z = model._y_values[:m] + model._y_values[m:]
+    selected = np.flatnonzero(model._x_values > 0.5)
+
+    components = DisjointSet(len(model._x_values))
+    for e in np.flatnonzero(z > 0.5):
+        components.union(tail[e], head[e])
+
+    comp = np.full(len(model._x_values), -1)
+    comp[selected] = [components.find(v) for v in selected]
+    sizes = np.bincount(comp[selected], minlength=len(comp))
+    edge_comp = np.where(comp[tail[:m]] == comp[head[:m]], comp[tail[:m]], -1)
+    selected_edges = np.flatnonzero((z > 0.5) & (edge_comp >= 0))
+    n_edges = np.bincount(edge_comp[selected_edges], minlength=len(comp))
+
+    roots = np.unique(comp[selected])
+    if len(roots) == 1 and n_edges[roots[0]] < sizes[roots[0]]:
+        return
+    main = roots[np.argmax(sizes[roots])]
+    j = selected[comp[selected] == main][0]
+
+    cuts = []
+    for c in roots:
+        S = np.flatnonzero(comp == c)
+        if n_edges[c] >= sizes[c]:
+            inside = np.flatnonzero(edge_comp == c)
+            cuts.append(Cut(np.concatenate((inside, inside + m, 2 * m + S[1:])),
+                            np.concatenate((-np.ones(2 * len(inside)), np.ones(len(S) - 1))), 0))
+        elif c != main:
+            crossing = np.flatnonzero((comp[tail[:m]] == c) != (comp[head[:m]] == c))
+            cuts.append(Cut(np.concatenate((crossing, crossing + m, [2 * m + S[0], 2 * m + j])),
+                            np.concatenate((np.ones(2 * len(crossing)), [-1, -1])), -1))
+    add_cuts(model, cuts)
 
 def add_violated_cec_frac(model: gp.Model):
+    # A cycle C violates sum_{a in C} y[a] <= |C| - 1 iff its length with arc weights 1 - y is below 1.
+    # For an arc (i,j) this is w(i,j) + dist(j, i) < 1, so one shortest path tree per head node j
+    # (truncated at length 1) checks all arcs leaving that tree's targets at once.
     tol = 1e-5
-    # Build directed graph with inverted weights
-    G = nx.DiGraph()
-    for (i,j),val in model._y_values.items():
-        G.add_edge(i, j, weight=max(0, 1-val))
-
-    # Iterate over all arcs
-    for i, j, weight in G.edges(data='weight'):
-        if not (model._x_values[i] > tol and model._x_values[j] > tol):
+    y, x = model._y_values, model._x_values
+    tail, head = model._tail, model._head
+    m = len(y) // 2
+
+    weight = np.maximum(1 - y, 0)
+    candidates = np.flatnonzero((y > tol) & (x[tail] > tol) & (x[head] > tol))
+    if len(candidates) == 0:
+        return
+
+    indptr, indices, position = model._arc_csr
+    data = np.empty(len(weight))
+    data[position] = weight
+    G = sp.csr_array((data, indices, indptr), shape=(len(x), len(x)))
+
+    sources = np.unique(head[candidates])
+    dist, pred = csgraph.dijkstra(G, directed=True, indices=sources, return_predecessors=True, limit=1.0)
+
+    row = np.searchsorted(sources, head[candidates])
+    length = weight[candidates] + dist[row, tail[candidates]]
+    violated = length < 1 - tol
+    order = np.argsort(length[violated])
+    candidates, row = candidates[violated][order], row[violated][order]
+
+    # add the most violated cycles first, each cycle only once per round
+    seen = set()
+    cuts = []
+    for a, p in zip(candidates, row):
+        if len(seen) >= MAX_CUTS_PER_ROUND:
+            break
+
+        # walk the shortest path j -> i backwards from i
+        cycle = [a]
+        v = tail[a]
+        while v != head[a]:
+            u = pred[p, v]
+            cycle.append(model._arc_index[u, v])
+            v = u
+
+        # the edges of a 2-cycle are already limited by y[i,j] + y[j,i] <= 1
+        key = frozenset(e % m for e in cycle)
+        if len(cycle) < 3 or key in seen:
             continue
-        
-        cost, path = nx.single_source_dijkstra(G, j, i)
-        if weight + cost < 1 - tol:
-            cycle = [(i,j)] + [(path[i], path[i+1]) for i in range(len(path) - 1)]
-            model.cbLazy(gp.quicksum(model._y[i,j] for i,j in cycle) <= len(cycle) - 1)
-            model._lazy_constrs_added += 1
-    pass
+        seen.add(key)
+
+        # lifted to both orientations of the cycle edges, still valid for |C| >= 3
+        cycle = np.array(cycle)
+        cuts.append(Cut(np.concatenate((cycle, (cycle + m) % (2 * m))), -1, 1 - len(cycle)))
+    add_cuts(model, cuts)
 
 
 def add_violated_dcc(model: gp.Model):
-    # Build the original graph with weighted edges
-    G = nx.DiGraph()
-    for (i, j), val in model._y_values.items():
-        G.add_edge(i, j, capacity=val)
-    
-    # Add the source node to the graph
-    G.add_node(0)
-    for i, val in model._r_value.items():
-        G.add_edge(0, i, capacity=val)
-
-    # Cutset algorithm
-    for t in G:
-        if t==0:
+    # Directed cutset inequalities y(delta^-(B)) + r(B) >= x[t] for sets B containing t, separated
+    # by max-flow from the artificial root 0 to t with capacities y (and r on the root arcs).
+    # Each violated max-flow yields the back cut (smallest sink set) and the forward cut (largest
+    # sink set); the forward cut arcs are then saturated to find nested cuts for the same target.
+    # Every support slot gets one extra unit of capacity so that ties are broken towards fewer arcs.
+    tol = 1e-5
+    src, dst = model._flow_network[3], model._flow_network[4]
+    values = np.concatenate((model._y_values, model._r_value))
+    capacity = np.rint(np.clip(values, 0, None) * FLOW_SCALE).astype(np.int32) + (values > tol)
+
+    network = capacity_matrix(model._flow_network, capacity)
+
+    n_arcs, n = len(model._y_values), len(model._x_values)
+    cuts = []
+    found = np.zeros(n + 1, dtype=bool)
+    for t in np.argsort(-model._x_values):
+        if model._x_values[t] <= tol or len(cuts) >= MAX_CUTS_PER_ROUND:
+            break
+        # t is dominated: a cut for a target with larger x already separated a set containing t
+        if found[t + 1]:
             continue
-        cut_val, (A, B) = nx.minimum_cut(G, 0, t)
-        if cut_val + 1e-5 < model._x_values[t]:
-            cut_edges = [(u,v) for (u,v) in model._y_values if u in A and v in B]
-            model.cbLazy(gp.quicksum(model._y[u,v] for (u,v) in cut_edges) >= model._x[t])
-            model._lazy_constrs_added += 1  
-            return # Only one constraint is added per solution
-    pass
+
+        C = network
+        for _ in range(MAX_NESTED_CUTS):
+            result = csgraph.maximum_flow(C, 0, t + 1)
+            if result.flow_value >= (model._x_values[t] - tol) * FLOW_SCALE:
+                break
+            source_side, sink_side = min_cut_sides(C, result.flow, t + 1)
+
+            new_cut = False
+            for B in (sink_side, ~source_side):
+                cut = np.flatnonzero(~B[src] & B[dst])
+                # check the violation on the unscaled values, the rounded capacities are only used to find the cut
+                if values[cut].sum() >= model._x_values[t] - tol or len(cuts) >= MAX_CUTS_PER_ROUND:
+                    continue
+
+                # root arc slots |A| + j map to r[j], which follows x in the stacked variables
+                cut[cut >= n_arcs] += n
+                cuts.append(Cut(np.append(cut, n_arcs + t), np.append(np.ones(len(cut)), -1), 0))
+                new_cut = True
+                found |= B
+
+                # back and forward cut coincide
+                if np.array_equal(sink_side, ~source_side):
+                    break
+
+            if not new_cut:
+                break
+            nested_capacity = capacity.copy()
+            nested_capacity[np.flatnonzero(source_side[src] & ~source_side[dst])] = FLOW_SCALE
+            C = capacity_matrix(model._flow_network, nested_capacity)
+    add_cuts(model, cuts)
+
+
+def build_csr(tail: np.ndarray, head: np.ndarray, n: int):
+    """CSR pattern of the directed graph with arcs (tail[a], head[a]) on n nodes.
+
+    Returns (indptr, indices, position) where position[a] is the index of arc a in the
+    CSR data array, so per-arc values can be scattered into a matrix without rebuilding it.
+    """
+    order = np.lexsort((head, tail))
+    indptr = np.zeros(n + 1, dtype=np.int32)
+    np.cumsum(np.bincount(tail, minlength=n), out=indptr[1:])
+    indices = head[order].astype(np.int32)
+    position = np.empty_like(order)
+    position[order] = np.arange(len(order))
+
+    return indptr, indices, position
+
+
+def build_flow_network(tail: np.ndarray, head: np.ndarray, n: int):
+    """CSR pattern of the separation network on the arcs and the artificial root.
+
+    Network node 0 is the artificial root and node p + 1 is node position p. Slots
+    0..|A|-1 are the arcs, slots |A|..|A|+n-1 are the root arcs (0,j). Returns
+    (indptr, indices, slot position in the CSR data, slot tails, slot heads).
+    """
+    src = np.concatenate((tail + 1, np.zeros(n, dtype=np.int64)))
+    dst = np.concatenate((head + 1, np.arange(1, n + 1)))
+
+    return *build_csr(src, dst, n + 1), src, dst
+
+
+def capacity_matrix(network, capacity: np.ndarray) -> sp.csr_array:
+    """Scatter integer slot capacities into the CSR pattern of the separation network."""
+    indptr, indices, position = network[0], network[1], network[2]
+    data = np.empty(len(capacity), dtype=np.int32)
+    data[position] = capacity
+    # slots without capacity do not change the flow, drop them to keep the network small
+    # (pruning works in place, so the shared pattern arrays are copied)
+    C = sp.csr_array((data, indices.copy(), indptr.copy()), shape=(len(indptr) - 1,) * 2)
+    C.eliminate_zeros()
+    return C
+
+
+def min_cut_sides(C: sp.csr_array, flow: sp.csr_array, t: int):
+    """Minimum cuts of a maximum flow from the artificial root to network node t.
+
+    Returns boolean masks of the network nodes reachable from the root and of those that
+    reach t in the residual graph of C. The complements of the former and the latter are
+    the sink sides of the forward and of the back minimum cut.
+    """
+    residual = (C - flow).tocsr()
+    residual.data[residual.data < 0] = 0
+    residual.eliminate_zeros()
+
+    reachable = csgraph.breadth_first_order(residual, 0, directed=True, return_predecessors=False)
+    source_side = np.zeros(C.shape[0], dtype=bool)
+    source_side[reachable] = True
+
+    reaching = csgraph.breadth_first_order(residual.T.tocsr(), t, directed=True, return_predecessors=False)
+    sink_side = np.zeros(C.shape[0], dtype=bool)
+    sink_side[reaching] = True
+
+    return source_side, sink_side
+
+
+def build_incidence(G: Graph):
+    """Index the arcs of G as arrays.
+
+    Arc a < m is edge a oriented (i,j), arc a + m is its reverse (j,i). Returns the node
+    labels, arc tail/head positions, arc costs and the sparse in/out node-arc incidence
+    matrices (|V| x |A|).
+    """
+    n, m = G.n, G.m
+
+    tail = np.concatenate((G.tail, G.head))
+    head = np.concatenate((G.head, G.tail))
+    arc_cost = np.concatenate((G.cost, G.cost))
+
+    arcs = np.arange(2 * m)
+    ones = np.ones(2 * m)
+    in_inc = sp.csr_matrix((ones, (head, arcs)), shape=(n, 2 * m))
+    out_inc = sp.csr_matrix((ones, (tail, arcs)), shape=(n, 2 * m))
+
+    return G.labels, tail, head, arc_cost, in_inc, out_inc
 
 
 def create_model(model: gp.Model):
     # see, e.g., https://docs.gurobi.com/projects/optimizer/en/current/reference/python.html
-    
-    model._lazy_constrs_added = 0
+    # all constraints are built from the node-arc incidence with the matrix API,
+    # so building scales linearly with |A| instead of scanning the arc list per node
+
+    model._lazy_constrs_added = model._user_cuts_added = 0
+    model._user_cuts = False
+    model._cut_node = -1
 
-    nodes: nx.Graph.nodes = model._original_graph.nodes
-    edges: nx.Graph.edges = model._original_graph.edges
     k = model._k
-    
-    dir_edges = [(i,j) for i,j in edges] + [(j,i) for i,j in edges]
+    nodes, tail, head, arc_cost, in_inc, out_inc = build_incidence(model._original_graph)
+    n = len(nodes)
+    m = len(tail) // 2
+
+    model._nodes = nodes
+    model._tail = tail
+    model._head = head
+    model._arc_index = {(i, j): a for a, (i, j) in enumerate(zip(tail.tolist(), head.tolist()))}
 
     # create common variables
-    # see, e.g., https://docs.gurobi.com/projects/optimizer/en/current/reference/python/model.html#Model.addVars
+    # see, e.g., https://docs.gurobi.com/projects/optimizer/en/current/reference/python/model.html#Model.addMVar
 
     # Variables for each node
-    x = model.addVars(nodes, vtype=GRB.BINARY, name='Node ')
-    # Variables for each edge
-    y = model.addVars(dir_edges, vtype=GRB.BINARY, name='Edge ')
+    x = model.addMVar(n, vtype=GRB.BINARY, name='Node ')
+    # Variables for each arc
+    y = model.addMVar(2 * m, vtype=GRB.BINARY, name='Edge ')
 
 
     # add reference to relevant variables for later use in callbacks (CEC,DCC)
 
     model._x = x
     model._y = y
+    model._r = model._u = model._f = model._f0 = None
+    model._arc_csr = model._flow_network = None
+    model._selected_edges = None
+    model._pool_constrs = {}
+    # replaced by the caller's profile to include the separator statistics in its results
+    model._profile = Profile()
+    model._heuristic_calls = 0
+
+    # cuts of all separators are stated over the stacked variables (y, x, r)
+    model._cut_vars = y.tolist() + x.tolist()
+    model._cut_pool = CutPool(2 * m + 2 * n)
 
     # create common constraints
-    # see, e.g., https://docs.gurobi.com/projects/optimizer/en/current/reference/python/model.html#Model.addConstr
+    # see, e.g., https://docs.gurobi.com/projects/optimizer/en/current/reference/python/model.html#Model.addMConstr
 
     # Number constraints
-    model.addConstr(gp.quicksum(x) == k)
-    model.addConstr(gp.quicksum(y) == k - 1)
+    # constraints with k in them are kept for update_k
+    model._k_constrs = {}
+    model._k_constrs["nodes"] = model.addConstr(x.sum() == k)
+    model._k_constrs["edges"] = model.addConstr(y.sum() == k - 1)
 
     # Linking nodes and edges
-    model.addConstrs(y[i,j] <= x[i] for i,j in dir_edges)
-    model.addConstrs(y[i,j] <= x[j] for i,j in dir_edges)
+    model.addConstr(y <= x[tail])
+    model.addConstr(y <= x[head])
 
     # Only one directional edge
-    model.addConstrs(y[i,j] + y[j,i] <= 1 for i,j in edges)
+    model.addConstr(y[:m] + y[m:] <= 1)
 
     # At most one incoming edge per node
-    model.addConstrs(gp.quicksum(y[i,j] for i in nodes if (i,j) in dir_edges) <= x[j] for j in nodes)
+    model.addConstr(in_inc @ y <= x)
 
     # Minimize edge weights
-    model.setObjective(gp.quicksum((y[i,j] + y[j,i]) * edges[i,j]['cost'] for i,j in edges))
+    model.setObjective(arc_cost @ y)
 
     # create model-specific variables and constraints
     if model._formulation == "seq":
         
         # Sequent variables
-        u = model.addVars(nodes, lb=0, ub=k+1, vtype=GRB.INTEGER, name='Order ')
-
-        """
-        Initial solution with artificial root node, guess it is not necessary
-
-        # Artificial root node (serves as a 'selector')
-        r = model.addVars(nodes, vtype=GRB.BINARY, name='Root ')
-
-        # One edge from root node to any other node (The node to which it points is the real root node)
-        model.addConstr(gp.quicksum(r) == 1)
-        model.addConstrs(r[i] <= x[i] for i in nodes)
-
-        # Root sequent
-        model.addConstrs(u[i] <= k * (1 - r[i]) for i in nodes)
-        """
+        u = model.addMVar(n, lb=0, ub=k+1, vtype=GRB.INTEGER, name='Order ')
 
-        # Sequent
-        model.addConstrs(u[i] + 1 <= u[j] + k * (1 - y[i,j]) for i,j in dir_edges)
-        
+        # Sequent: u[i] + 1 <= u[j] + k * (1 - y[i,j])
+        model._k_constrs["order"] = model.addConstr(u[tail] - u[head] + k * y <= k - 1)
+        model._u = u
 
         pass
-    elif model._formulation == "scf":
+    elif model._formulation == "seq+":
+
+        # Lifted MTZ (Desrochers-Laporte) with the positions u in the tree: the root has
+        # position 1, a node with an incoming arc at least 2, and a node at position u with
+        # c children leaves room for the c children below it, so u + c <= k.
+        # u can be continuous, the order constraints alone exclude cycles
+        u = model.addMVar(n, lb=1, ub=k, vtype=GRB.CONTINUOUS, name='Order ')
+        reverse = np.concatenate((np.arange(m, 2 * m), np.arange(m)))
+
+        # u[j] = u[i] + 1 if y[i,j] = 1, u[i] = u[j] + 1 if y[j,i] = 1, |u[i] - u[j]| <= k - 1 otherwise
+        model._k_constrs["order"] = model.addConstr(u[tail] - u[head] + k * y + (k - 2) * y[reverse] <= k - 1)
+        # Root-aware bounds: nodes without an incoming arc (the root and unselected nodes) are at position 1
+        model.addConstr(u >= 1 + in_inc @ y)
+        model._k_constrs["depth"] = model.addConstr(u - (k - 1) * (in_inc @ y) <= 1)
+        model._k_constrs["leaf"] = model.addConstr(u + out_inc @ y <= k)
+        model._u = u
 
-        dir_edges_with_0 = dir_edges + [(0, j) for j in nodes]
+        pass
+    elif model._formulation in ("scf", "scf+"):
 
-        # Flow variable
-        f = model.addVars(dir_edges_with_0, lb=0, vtype=GRB.CONTINUOUS, name='Flow ')
+        # Flow variables on the arcs and on the arcs (0,j) leaving the artificial root
+        f = model.addMVar(2 * m, lb=0, vtype=GRB.CONTINUOUS, name='Flow ')
+        f0 = model.addMVar(n, lb=0, vtype=GRB.CONTINUOUS, name='Root flow ')
 
         # Artificial root node (serves as a 'selector')
-        r = model.addVars(nodes, vtype=GRB.BINARY, name='Root ')
+        r = model.addMVar(n, vtype=GRB.BINARY, name='Root ')
 
         # One edge from root node to any other node (The node to which it points is the real root node)
-        model.addConstr(gp.quicksum(r) == 1)
-        model.addConstrs(r[i] <= x[i] for i in nodes)
+        model.addConstr(r.sum() == 1)
+        model.addConstr(r <= x)
 
         # Flow constraints
-        model.addConstrs(f[0,j] == k * r[j] for j in nodes)
-        model.addConstrs(gp.quicksum(f[i,j] for i, l in dir_edges_with_0 if l==j) -
-                         gp.quicksum(f[j,l] for i, l in dir_edges_with_0 if i==j) == x[j] for j in nodes)
-        model.addConstrs(f[i,j] <= k * y[i,j] for i,j in dir_edges)
+        model._k_constrs["root_flow"] = model.addConstr(f0 == k * r)
+        model.addConstr(f0 + in_inc @ f - out_inc @ f == x)
+        if model._formulation == "scf":
+            model._k_constrs["flow_capacity"] = model.addConstr(f <= k * y)
+        else:
+            # An arc enters a non-root node, so it carries at most the k - 1 units of the nodes
+            # other than the root, and at least the unit of its head
+            model._k_constrs["flow_capacity"] = model.addConstr(f <= (k - 1) * y)
+            model.addConstr(f >= y)
+            # Every selected node except the root has exactly one incoming arc
+            model.addConstr(in_inc @ y == x - r)
+        model._r, model._f, model._f0 = r, f, f0
 
         pass
 
     elif model._formulation == "mcf":
 
-        dir_edges_with_0 = dir_edges + [(0, j) for j in nodes]
-        commodity_vars = [(i,j,c) for i,j in dir_edges_with_0 for c in nodes]
-
-        # Flow variable
-        f = model.addVars(commodity_vars, lb=0, vtype=GRB.BINARY, name='Flow ')
+        # Flow variables f[a,c] of commodity c on arc a, and f0[j,c] on the root arc (0,j)
+        f = model.addMVar((2 * m, n), lb=0, vtype=GRB.BINARY, name='Flow ')
+        f0 = model.addMVar((n, n), lb=0, vtype=GRB.BINARY, name='Root flow ')
 
         # Artificial root node (serves as a 'selector')
-        r = model.addVars(nodes, vtype=GRB.BINARY, name='Root ')
+        r = model.addMVar(n, vtype=GRB.BINARY, name='Root ')
 
         # One edge from root node to any other node (The node to which it points is the real root node) (all hail the real root node)
-        model.addConstr(gp.quicksum(r) == 1)
-        model.addConstrs(r[i] <= x[i] for i in nodes)
+        model.addConstr(r.sum() == 1)
+        model.addConstr(r <= x)
+
+        # Column a*n + c of the flattened f is arc a carrying commodity c
+        f_flat = f.reshape(-1)
+        commodities = np.arange(n)
+        cols = (np.arange(2 * m)[:, None] * n + commodities).ravel()
+        rows_in = (head[:, None] * n + commodities).ravel()
+        rows_out = (tail[:, None] * n + commodities).ravel()
 
         # Flow constraints
-        model.addConstrs(gp.quicksum(f[0,j,c] for j in nodes) == x[c] for c in nodes)   # An ominous source node 0 sends out k packages, addressed to each node that is included in the MST
-        model.addConstrs(f[0,i,c] <= r[i] for i in nodes for c in nodes)                # The first address for all packages is always the artificial root node in the graph
-        model.addConstrs(gp.quicksum(f[i,c,c] for i,j2 in dir_edges if j2==c) == x[c]-r[c] for c in nodes)  # Each included non-root node in the MST consumes one package
-        model.addConstrs(gp.quicksum(f[i,j,c] for (i, j2) in dir_edges_with_0 if j2 == j) -     # Packages are forwarded, if current node is not the destination
-                         gp.quicksum(f[j,i,c] for (j2, i) in dir_edges_with_0 if j2 == j) == 0 for j in nodes for c in nodes if j!=c)  # This also ensures, that packages cannot backflow to 0
-        model.addConstrs(f[i,j,c] <= y[i,j] for (i,j) in dir_edges for c in nodes)      # If there is flow on an edge, include it in the MST
+        model.addConstr(f0.sum(axis=0) == x)        # An ominous source node 0 sends out k packages, addressed to each node that is included in the MST
+        model.addConstr(f0 <= r[:, None])           # The first address for all packages is always the artificial root node in the graph
+        consume = sp.csr_matrix((np.ones(2 * m), (head, np.arange(2 * m) * n + head)), shape=(n, 2 * m * n))
+        model.addConstr(consume @ f_flat == x - r)  # Each included non-root node in the MST consumes one package
+        balance = sp.csr_matrix((np.concatenate((np.ones(len(cols)), -np.ones(len(cols)))),
+                                 (np.concatenate((rows_in, rows_out)), np.concatenate((cols, cols)))),
+                                shape=(n * n, 2 * m * n))
+        forward = (np.arange(n)[:, None] != commodities).ravel()
+        model.addConstr(f0.reshape(-1)[forward] + balance[forward] @ f_flat == 0)  # Packages are forwarded, if current node is not the destination
+                                                                                    # This also ensures, that packages cannot backflow to 0
+        model.addConstr(f <= y[:, None])            # If there is flow on an edge, include it in the MST
+        model._r, model._f, model._f0 = r, f, f0
         
         pass
 
     elif model._formulation == "cec":
 
+        model._arc_csr = build_csr(tail, head, n)
+
         pass
 
-    elif model._formulation == "dcc":
+    elif model._formulation in ("dcc", "mcf-lazy"):
+
+        # mcf-lazy is MCF projected onto (x, y, r): its commodities are only represented by
+        # Benders feasibility cuts. Commodity c can be routed iff the max-flow from the
+        # artificial root to c is at least x[c], and the dual of an infeasible subproblem is a
+        # min cut, i.e. the directed cutset inequality y(delta^-(B)) + r(B) >= x[c]. The
+        # projection is therefore the DCC formulation, and both are solved by it.
 
         # Root node definition
-        r = model.addVars(nodes, vtype=GRB.BINARY, name='Root ')
-        model.addConstr(gp.quicksum(r) == 1)
-        model.addConstrs(r[i] <= x[i] for i in nodes)
+        r = model.addMVar(n, vtype=GRB.BINARY, name='Root ')
+        model.addConstr(r.sum() == 1)
+        model.addConstr(r <= x)
         model._r = r
 
         # If a node is selected and not the root node, then at least one node is incoming (necessary for optimality)
-        model.addConstrs(x[j] - r[j] <= gp.quicksum(y[i,j] for i,l in dir_edges if l==j) for j in nodes)
+        model.addConstr(x - r <= in_inc @ y)
+
+        model._flow_network = build_flow_network(tail, head, n)
 
         pass
 
-def get_selected_edge_ids(model: gp.Model) -> list[int]:
-    # note that you may need to account for tolerances
-    # see, e.g., https://docs.gurobi.com/projects/optimizer/en/current/concepts/modeling/tolerances.html
+    if model._r is not None:
+        model._cut_vars += model._r.tolist()
+
+def update_k(model: gp.Model, k: int):
+    """Change k of a built model in place (right-hand sides, the coefficients with k in them and the order bounds)."""
+    model._k = k
+    constrs = model._k_constrs
+    constrs["nodes"].RHS = k
+    constrs["edges"].RHS = k - 1
+
+    if "order" in constrs:
+        # u[tail] - u[head] + k * y[a] (+ (k - 2) * y[reverse of a] for seq+) <= k - 1, one row per arc
+        y = model._y.tolist()
+        constrs["order"].RHS = k - 1
+        rows = constrs["order"].tolist()
+        for row, var in zip(rows, y):
+            model.chgCoeff(row, var, k)
+        if model._formulation == "seq+":
+            model._u.UB = k
+            m = len(y) // 2
+            for row, var in zip(rows, y[m:] + y[:m]):
+                model.chgCoeff(row, var, k - 2)
+        else:
+            model._u.UB = k + 1
+
+    if "depth" in constrs:
+        # u[j] - (k - 1) * y(delta^-(j)) <= 1 and u[i] + y(delta^+(i)) <= k
+        depth = constrs["depth"].tolist()
+        for var, j in zip(model._y.tolist(), model._head.tolist()):
+            model.chgCoeff(depth[j], var, -(k - 1))
+        constrs["leaf"].RHS = k
+
+    if "root_flow" in constrs:
+        # f0 - k * r == 0 and f - k * y <= 0 (f - (k - 1) * y <= 0 for scf+)
+        capacity = k - 1 if model._formulation == "scf+" else k
+        for row, r in zip(constrs["root_flow"].tolist(), model._r.tolist()):
+            model.chgCoeff(row, r, -k)
+        for row, y in zip(constrs["flow_capacity"].tolist(), model._y.tolist()):
+            model.chgCoeff(row, y, -capacity)
+
+
+def fix_variables(model: gp.Model, fixed_nodes: np.ndarray, fixed_edges: np.ndarray):
+    """Fix x of the given nodes and y of both arcs of the given edges to zero, releasing earlier fixings."""
+    model._x.UB = np.where(fixed_nodes, 0, 1)
+    model._y.UB = np.tile(np.where(fixed_edges, 0, 1), 2)
+
+
+def add_pool_constraints(model: gp.Model):
+    """Add the pooled cuts of earlier solves as lazy model constraints, callbacks' cbLazy cuts do not outlive a solve."""
+    for key, cut in model._cut_pool.cuts.items():
+        if key not in model._pool_constrs:
+            constr = model.addConstr(gp.LinExpr(cut.coef.tolist(), [model._cut_vars[i] for i in cut.index]) >= cut.rhs)
+            constr.Lazy = 1
+            model._pool_constrs[key] = constr
+
+
+def get_solution_tree(model: gp.Model) -> KTree:
+    edges = get_selected_edges(model)
+    nodes = np.flatnonzero(model._x.getAttr(GRB.Attr.X) > 0.5)
+    return KTree(nodes, edges, model._original_graph.cost[edges].sum())
+
+
+def start_values(model: gp.Model, tree: KTree) -> list[tuple]:
+    """Values of the model variables for a k-tree, as (MVar, array) pairs.
+
+    The tree is rooted at its first node: the arcs point away from it, the order variables
+    are the depths and every arc carries one unit of flow per node below it.
+    """
+    n, n_arcs = len(model._nodes), len(model._tail)
+    m = n_arcs // 2
+    root, parent, depth, size = tree.orient(model._tail[:m], model._head[:m])
+
+    x = np.zeros(n)
+    x[tree.nodes] = 1
+    y = np.zeros(n_arcs)
+    y[[a for _, a in parent.values()]] = 1
+    values = [(model._x, x), (model._y, y)]
+
+    if model._r is not None:
+        r = np.zeros(n)
+        r[root] = 1
+        values.append((model._r, r))
+
+    if model._u is not None:
+        u = np.zeros(n)
+        u[list(depth)] = list(depth.values())
+        if model._formulation == "seq+":
+            # positions start at 1
+            u += 1
+        values.append((model._u, u))
+
+    if model._formulation in ("scf", "scf+"):
+        f = np.zeros(n_arcs)
+        for w, (_, a) in parent.items():
+            f[a] = size[w]
+        f0 = model._k * r
+        values += [(model._f, f), (model._f0, f0)]
+
+    elif model._formulation == "mcf":
+        # commodity c travels along the tree path from the root to c
+        f = np.zeros((n_arcs, n))
+        f0 = np.zeros((n, n))
+        for c in depth:
+            f0[root, c] = 1
+            v = c
+            while v != root:
+                v, a = parent[v]
+                f[a, c] = 1
+        values += [(model._f, f), (model._f0, f0)]
+
+    return values
+
 
-    # https://docs.gurobi.com/projects/optimizer/en/current/concepts/attributes/examples.html
-    return [model._original_graph.edges[edge]["id"] for edge in model._original_graph.edges if model._y[edge].X == 1 or model._y[edge[1],edge[0]].X == 1]
\ No newline at end of file
+def set_start(model: gp.Model, tree: KTree):
+    for var, value in start_values(model, tree):
+        var.Start = value
+
+
+def get_selected_edges(model: gp.Model) -> np.ndarray:
+    """Positions of the edges in the solution, read in one batch and cached for later calls."""
+    if model._selected_edges is None:
+        # binaries are only integral up to the integrality tolerance, e.g. 0.9999999
+        # see, e.g., https://docs.gurobi.com/projects/optimizer/en/current/concepts/modeling/tolerances.html
+        y = model._y.getAttr(GRB.Attr.X)
+        m = len(y) // 2
+        model._selected_edges = np.flatnonzero(y[:m] + y[m:] > 0.5)
+    return model._selected_edges
+
+
+def get_selected_edge_ids(model: gp.Model) -> list[int]:
+    return model._original_graph.ids[get_selected_edges(model)].tolist()
@@ -0,0 +1,68 @@
+import time
+from contextlib import contextmanager
+
+# phases of a solve in the order they run, see kmst.solve
+PHASES = ("read", "heuristic", "reduction", "lagrangian", "create_model", "update", "optimize", "validation")
+# the pool check and the separators of model.py (add_violated_<name>)
+SEPARATORS = ("pool", "cec_int", "cec_frac", "dcc")
+
+# result fields written by Profile.results, in CSV column order
+PROFILE_HEADERS = [f"time_{phase}" for phase in PHASES] + [
+    f"sep_{name}_{stat}" for name in SEPARATORS for stat in ("calls", "time", "max_time", "cuts_per_call")]
+
+
+class SeparatorStats:
+    __slots__ = ("calls", "time", "max_time", "cuts")
+
+    def __init__(self):
+        self.calls = 0
+        self.time = 0.0
+        self.max_time = 0.0
+        self.cuts = 0
+
+
+class Profile:
+    """Wall-clock times of the phases of a solve and call statistics of the separators.
+
+    Phases are timed with the phase context manager (repeated phases add up), separator
+    calls are recorded by model.separate. results() flattens both into result fields.
+    """
+
+    def __init__(self):
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.separators = {name: SeparatorStats() for name in SEPARATORS}
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def record_separator(self, name: str, seconds: float, n_cuts: int):
+        stats = self.separators.setdefault(name, SeparatorStats())
+        stats.calls += 1
+        stats.time += seconds
+        stats.max_time = max(stats.max_time, seconds)
+        stats.cuts += n_cuts
+
+    def add(self, other: "Profile"):
+        """Add the phase times and separator calls of another profile, e.g. of a worker process."""
+        for name, seconds in other.phases.items():
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+        for name, theirs in other.separators.items():
+            stats = self.separators.setdefault(name, SeparatorStats())
+            stats.calls += theirs.calls
+            stats.time += theirs.time
+            stats.max_time = max(stats.max_time, theirs.max_time)
+            stats.cuts += theirs.cuts
+
+    def results(self) -> dict:
+        results = {f"time_{phase}": round(seconds, 4) for phase, seconds in self.phases.items()}
+        for name, stats in self.separators.items():
+            results[f"sep_{name}_calls"] = stats.calls
+            results[f"sep_{name}_time"] = round(stats.time, 4)
+            results[f"sep_{name}_max_time"] = round(stats.max_time, 4)
+            results[f"sep_{name}_cuts_per_call"] = round(stats.cuts / stats.calls, 2) if stats.calls else 0
+        return results
@@ -0,0 +1,202 @@
+import argparse
+import math
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import gurobipy as gp
+from gurobipy import GRB
+import numpy as np
+
+from graph import Graph
+from heuristic import KTree
+from kmst import COUNTERS, build_results, configure_model, model_counters, preprocess
+from model import create_model, lazy_constraint_callback, set_start, start_values
+from profiling import Profile
+from util import init_worker, worker_env, worker_state, write_solution
+
+# a bound within this of the incumbent proves it optimal
+TOL = 1e-6
+
+
+class RaceState:
+    """What the workers of a race share: the best tree as (cost, edge positions, version), the best bound and a stop flag.
+
+    The tree fields are only written under the lock of cost; version counts the published
+    trees, so a worker can tell whether it has seen the current one.
+    """
+
+    def __init__(self, context, k: int, tree: KTree | None):
+        self.cost = context.Value("d", math.inf)
+        self.edges = context.Array("q", max(k - 1, 1), lock=False)
+        self.version = context.Value("i", 0, lock=False)
+        self.bound = context.Value("d", -math.inf)
+        self.stop = context.Event()
+        if tree is not None:
+            self.publish(tree.cost, tree.edges)
+
+    def publish(self, cost: float, edges: np.ndarray) -> bool:
+        """Make the tree the shared incumbent if it is better, returns whether it was."""
+        with self.cost.get_lock():
+            if cost >= self.cost.value - TOL:
+                return False
+            self.cost.value = cost
+            self.edges[:len(edges)] = edges.tolist()
+            self.version.value += 1
+            return True
+
+    def tree(self, G: Graph, k: int) -> tuple[int, KTree | None]:
+        """The version and the shared tree as a k-tree of G."""
+        with self.cost.get_lock():
+            version, cost = self.version.value, self.cost.value
+            edges = np.array(self.edges[:k - 1], dtype=np.int64)
+        if version == 0:
+            return 0, None
+        nodes = np.unique(np.concatenate((G.tail[edges], G.head[edges]))) if len(edges) else np.zeros(1, dtype=np.int64)
+        return version, KTree(nodes, edges, cost)
+
+    def raise_bound(self, bound: float) -> float:
+        with self.bound.get_lock():
+            self.bound.value = max(self.bound.value, bound)
+            return self.bound.value
+
+
+def race_callback(model: gp.Model, where):
+    state = model._race
+    if state.stop.is_set():
+        model.terminate()
+        return
+
+    if where == GRB.Callback.MIPSOL:
+        # solutions of the lazy formulations are only feasible if the separators found no violated cut
+        n_lazy = model._lazy_constrs_added
+        lazy_constraint_callback(model, where)
+        if model._lazy_constrs_added == n_lazy:
+            y = model.cbGetSolution(model._y)
+            m = len(y) // 2
+            edges = np.flatnonzero(y[:m] + y[m:] > 0.5)
+            state.publish(model.cbGet(GRB.Callback.MIPSOL_OBJ), edges)
+        return
+
+    lazy_constraint_callback(model, where)
+    if where == GRB.Callback.MIPNODE and model.cbGet(GRB.Callback.MIPNODE_STATUS) == GRB.OPTIMAL:
+        # take over a better tree of another formulation
+        if state.version.value != model._race_version:
+            model._race_version, tree = state.tree(model._original_graph, model._k)
+            if tree is not None and tree.cost < model.cbGet(GRB.Callback.MIPNODE_OBJBST) - TOL:
+                for var, value in start_values(model, tree):
+                    model.cbSetSolution(var.reshape(-1).tolist(), value.ravel().tolist())
+                model.cbUseSolution()
+    elif where == GRB.Callback.MIP:
+        # every formulation bounds the same problem, together they may prove the shared tree optimal
+        bound = state.raise_bound(model.cbGet(GRB.Callback.MIP_OBJBND))
+        if bound >= state.cost.value - TOL:
+            model._proven = True
+            model.terminate()
+
+
+def race_formulation(formulation: str, tree: KTree | None, deadline: float) -> dict:
+    """Solves the shared graph with one formulation of the race. Runs in a worker process."""
+    # the graph, the options and the race state of solve_race
+    H, args, state = worker_state()
+    profile = Profile()
+    result = {"formulation": formulation, "status": "stopped", "bound": -math.inf, "runtime": 0.0, "n_nodes": 0,
+              **dict.fromkeys(COUNTERS, 0), "profile": profile}
+    time_left = deadline - time.time()
+    if time_left <= 0 or state.stop.is_set():
+        return result
+
+    with gp.Model(formulation, env=worker_env()) as model:
+        model._original_graph = H
+        model._k = args.k
+        model._formulation = formulation
+        model._heuristic = args.heuristic_roots > 0
+        model._cut_rounds, model._cut_nodes, model._cut_violation = args.cut_rounds, args.cut_nodes, args.cut_violation
+        model._race = state
+        model._race_version = 0
+        model._proven = False
+
+        with profile.phase("create_model"):
+            create_model(model)
+        model._profile = profile
+        with profile.phase("update"):
+            model.update()
+        if tree is not None:
+            set_start(model, tree)
+
+        configure_model(model, argparse.Namespace(**{**vars(args), "formulation": formulation}))
+        model.Params.TimeLimit = time_left
+        with profile.phase("optimize"):
+            model.optimize(race_callback)
+
+        if model.Status == GRB.OPTIMAL or model._proven:
+            result["status"] = "optimal"
+        elif model.Status == GRB.TIME_LIMIT:
+            result["status"] = "timeout"
+        result.update(bound=model.ObjBound, runtime=model.Runtime, n_nodes=round(model.NodeCount), **model_counters(model))
+    return result
+
+
+def solve_race(G: Graph, args: argparse.Namespace, profile: Profile | None = None) -> dict:
+    """Solves the instance with all args.race_formulations at once, one worker process each.
+
+    The workers share their feasible trees, which the others inject as heuristic
+    solutions, and their bounds. The race ends when the first worker proves optimality
+    (by its own bound or by the shared one); it reports its formulation as the winner.
+    The results have the keys of kmst.solve with formulation "race" (see kmst.build_results).
+    The runtime is the Gurobi time of the winner (of the longest worker without one), node
+    and cut counts and phase times add up over the workers.
+    """
+    profile = profile or Profile()
+    start_time = time.time()
+    deadline = start_time + args.timelimit
+    tree, lagrangian, H = preprocess(G, args, profile)
+
+    context = multiprocessing.get_context("spawn")
+    state = RaceState(context, args.k, tree)
+    formulations = list(dict.fromkeys(args.race_formulations))
+    print(f"Racing {', '.join(formulations)}")
+
+    winner = None
+    workers = []
+    with ProcessPoolExecutor(max_workers=len(formulations), mp_context=context, initializer=init_worker,
+                             initargs=(H, args, state)) as pool:
+        futures = {pool.submit(race_formulation, formulation, tree, deadline): formulation for formulation in formulations}
+        for future in as_completed(futures):
+            # a formulation that fails (e.g. its model is too large) drops out of the race
+            try:
+                worker = future.result()
+            except Exception as e:
+                print(f"{futures[future]} failed: {e!r}")
+                continue
+            profile.add(worker.pop("profile"))
+            workers.append(worker)
+            if worker["status"] == "optimal" and winner is None:
+                winner = worker["formulation"]
+                print(f"{winner} won after {worker['runtime']:.2f}s")
+                state.stop.set()
+
+    _, best = state.tree(H, args.k)
+    best_edges = H.ids[best.edges].tolist() if best is not None else None
+    best_cost = best.cost if best is not None else math.inf
+    if winner is not None:
+        status, best_bound = GRB.OPTIMAL, best_cost
+        # the race took as long as the winner needed to prove optimality
+        runtime = next(w["runtime"] for w in workers if w["formulation"] == winner)
+    else:
+        status = GRB.TIME_LIMIT if best is not None else GRB.INFEASIBLE
+        best_bound = max([state.bound.value] + [w["bound"] for w in workers])
+        runtime = max([0.0] + [w["runtime"] for w in workers])
+
+    # the workers run in parallel, so the wall time is measured here instead of added up from the phases
+    wall_time = profile.phases["read"] + time.time() - start_time
+    counters = {key: sum(w[key] for w in workers) for key in COUNTERS}
+    results = build_results(args, G, args.k, "race", status, best_cost, best_bound, runtime,
+                            sum(w["n_nodes"] for w in workers), best_edges, tree, lagrangian, G.n - H.n, G.m - H.m,
+                            counters, profile, wall_time=wall_time)
+    results["winner"] = winner
+    results["race_runtimes"] = {w["formulation"]: round(w["runtime"], 3) for w in workers}
+
+    if args.solution_file and best_edges is not None:
+        write_solution(args.solution_file, best_edges)
+    return results
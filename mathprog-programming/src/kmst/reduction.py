@@ -0,0 +1,67 @@
+import math
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse import csgraph
+
+from graph import Graph
+from heuristic import KTree
+
+
+def reduce_graph(G: Graph, k: int, upper_bound: float = math.inf, tol: float = 1e-6) -> Graph:
+    """Subgraph of G that still contains every optimal k-tree.
+
+    Two tests are applied until neither removes anything:
+    - nodes in connected components with fewer than k nodes cannot be part of a k-tree,
+    - any k-tree in the component of edge e that contains e costs at least c_e plus the
+      k-2 cheapest other edges of that component, so e is dropped if this exceeds the
+      cost of a known k-tree (upper_bound).
+    Note that the MST cycle test (drop the most expensive edge of a cycle) does not carry
+    over, since a k-tree need not be part of a minimum spanning tree.
+
+    Nodes and edges keep their labels and ids.
+    """
+    n, tail, head, cost = G.n, G.tail, G.head, G.cost
+    alive_node = np.ones(n, dtype=bool)
+    alive_edge = np.ones(len(tail), dtype=bool)
+
+    while True:
+        edges = np.flatnonzero(alive_edge)
+        adjacency = sp.coo_array((np.ones(len(edges)), (tail[edges], head[edges])), shape=(n, n))
+        _, label = csgraph.connected_components(adjacency, directed=False)
+        size = np.bincount(label)
+
+        small = alive_node & (size[label] < k)
+        alive_node &= ~small
+        alive_edge &= alive_node[tail] & alive_node[head]
+
+        expensive = np.zeros(len(tail), dtype=bool)
+        if k >= 2 and math.isfinite(upper_bound):
+            edges = np.flatnonzero(alive_edge)
+            comp = label[tail[edges]]
+            order = np.lexsort((cost[edges], comp))
+            edges, comp = edges[order], comp[order]
+
+            # rank of every edge within its component (by cost) and prefix sums of the costs
+            start = np.flatnonzero(np.r_[True, comp[1:] != comp[:-1]])
+            count = np.diff(np.r_[start, len(edges)])
+            first, last = np.repeat(start, count), np.repeat(start + count, count)
+            rank = np.arange(len(edges)) - first
+            prefix = np.r_[0, np.cumsum(cost[edges])]
+
+            # sum of the k-2 cheapest edges of the component, and the k-1 cheapest if e is among them
+            cheapest = prefix[np.minimum(first + k - 2, last)] - prefix[first]
+            cheapest_but_e = prefix[np.minimum(first + k - 1, last)] - prefix[first] - cost[edges]
+            lower_bound = cost[edges] + np.where(rank < k - 2, cheapest_but_e, cheapest)
+            expensive[edges[lower_bound > upper_bound + tol]] = True
+            alive_edge &= ~expensive
+
+        if not small.any() and not expensive.any():
+            break
+
+    return G.subgraph(alive_node, alive_edge)
+
+
+def transfer_tree(tree: KTree, G: Graph, H: Graph) -> KTree:
+    """The k-tree of G as a k-tree of its subgraph H (positions refer to the respective graph)."""
+    return KTree(H.node_index(G.labels[tree.nodes]), H.edge_index(G.ids[tree.edges]), tree.cost)
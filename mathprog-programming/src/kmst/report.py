@@ -0,0 +1,315 @@
+# report.py
+
+import argparse
+import csv
+import math
+from pathlib import Path
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+
+from resultstore import ResultStore, result_key
+from util import read_instance_arrays
+
+DATA_DIR_DEFAULT = "mathprog-programming/data"
+RESULTS_DEFAULT = "benchmark_results.jsonl"
+OUTPUT_DIR_DEFAULT = "benchmark_report"
+# runs that did not finish with a valid optimal solution count with the time limit (see benchmarking.TIMELIMIT)
+TIMELIMIT = 3600
+# Gurobi status codes
+OPTIMAL = 2
+TIME_LIMIT = 9
+# resolution of the reported runtimes, shorter runs count with this time in ratios, fits and log plots
+MIN_RUNTIME = 0.001
+# shifts of the shifted geometric means, so that very small values do not dominate
+TIME_SHIFT = 10.0
+NODE_SHIFT = 100.0
+
+
+def load_results(path: str | Path) -> list[dict]:
+    """Results of a result store (.jsonl) or an exported CSV file, the latest per (instance, k, formulation)."""
+    path = Path(path)
+    if path.suffix == ".jsonl":
+        results = ResultStore(path).read()
+    else:
+        with open(path, newline="", encoding="utf-8") as f:
+            results = [{key: parse_value(value) for key, value in row.items()} for row in csv.DictReader(f)]
+    return list({result_key(result): result for result in results}.values())
+
+
+def parse_value(value: str):
+    if value in ("", "None"):
+        return None
+    if value in ("True", "False"):
+        return value == "True"
+    try:
+        number = float(value)
+    except ValueError:
+        return value
+    return int(number) if number.is_integer() and "." not in value else number
+
+
+def is_solved(result: dict) -> bool:
+    return result.get("status") == OPTIMAL and bool(result.get("is_valid_k_mst"))
+
+
+def solve_time(result: dict | None, timelimit: float) -> float:
+    """Runtime of a solved run, the time limit otherwise (also for missing runs)."""
+    if result is None or not is_solved(result):
+        return timelimit
+    return min(runtime(result), timelimit)
+
+
+def runtime(result: dict) -> float:
+    return max(float(result["runtime"]), MIN_RUNTIME)
+
+
+def shifted_geometric_mean(values, shift: float) -> float:
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return math.nan
+    return float(np.exp(np.mean(np.log(values + shift))) - shift)
+
+
+def instance_sizes(results: list[dict], data_dir: Path) -> dict[str, tuple[int, int]]:
+    """(|V|, |E|) of the instances of the results that are found in data_dir.
+
+    benchmarking.py stores the instance stem ("g01"), kmst.py the last characters of the path ("g01.dat").
+    """
+    sizes = {}
+    for instance in {result["instance"] for result in results}:
+        path = data_dir / Path(instance).name
+        if not path.suffix:
+            path = path.with_suffix(".dat")
+        if path.exists():
+            n_nodes, edges = read_instance_arrays(str(path))
+            sizes[instance] = (n_nodes, len(edges))
+    return sizes
+
+
+class Report:
+    """Benchmark results arranged by problem (instance, k) and formulation."""
+
+    def __init__(self, results: list[dict], timelimit: float = TIMELIMIT):
+        self.results = results
+        self.timelimit = timelimit
+        self.formulations = list(dict.fromkeys(result["formulation"] for result in results))
+        self.problems = sorted({(result["instance"], int(result["k"])) for result in results})
+        self.runs = {(result["instance"], int(result["k"]), result["formulation"]): result for result in results}
+
+    def run(self, problem: tuple, formulation: str) -> dict | None:
+        return self.runs.get((*problem, formulation))
+
+    def times(self) -> np.ndarray:
+        """Solve times as a (problem, formulation) array, unsolved runs at the time limit."""
+        return np.array([[solve_time(self.run(p, f), self.timelimit) for f in self.formulations] for p in self.problems])
+
+    def solved(self) -> np.ndarray:
+        return np.array([[self.run(p, f) is not None and is_solved(self.run(p, f)) for f in self.formulations]
+                         for p in self.problems], dtype=bool)
+
+    def performance_profile(self) -> tuple[np.ndarray, np.ndarray]:
+        """Dolan-More profile: per formulation the sorted ratios to the best time per problem (inf if unsolved).
+
+        rho_f(tau) is the fraction of the problems whose ratio is at most tau.
+        """
+        times, solved = self.times(), self.solved()
+        best = np.where(solved, times, np.inf).min(axis=1, keepdims=True)
+        ratios = np.where(solved, times / best, np.inf)
+        # problems no formulation solved are left out
+        ratios = ratios[np.isfinite(best[:, 0])]
+        return np.sort(ratios, axis=0), np.arange(1, len(ratios) + 1) / max(len(self.problems), 1)
+
+    def summary(self) -> list[dict]:
+        """Per formulation the number of runs, solved runs and time-outs, shifted geometric means and the mean gap."""
+        rows = []
+        times, solved = self.times(), self.solved()
+        for column, formulation in enumerate(self.formulations):
+            runs = [self.run(p, formulation) for p in self.problems]
+            present = [run for run in runs if run is not None]
+            unsolved_gaps = [float(run["gap"]) for run in present if not is_solved(run) and run.get("gap") is not None]
+            rows.append({
+                "formulation": formulation,
+                "runs": len(present),
+                "solved": int(solved[:, column].sum()),
+                "timeouts": sum(run.get("status") == TIME_LIMIT for run in present),
+                "sgm_time": shifted_geometric_mean(times[:, column], TIME_SHIFT),
+                "sgm_nodes": shifted_geometric_mean([run.get("n_nodes") or 0 for run in present], NODE_SHIFT),
+                "mean_lazy": float(np.mean([run.get("n_lazy_constraints") or 0 for run in present])) if present else math.nan,
+                "mean_gap_unsolved": float(np.mean(unsolved_gaps)) if unsolved_gaps else math.nan,
+            })
+        return rows
+
+    def scaling_fits(self, sizes: dict) -> dict[str, tuple[float, float, float, int]]:
+        """Least-squares fit runtime = c * |E|^b on the solved runs of each formulation, as (c, b, R^2, runs)."""
+        fits = {}
+        for formulation in self.formulations:
+            points = [(sizes[run["instance"]][1], runtime(run)) for run in self.results
+                      if run["formulation"] == formulation and is_solved(run) and run["instance"] in sizes]
+            if len({m for m, _ in points}) < 2:
+                continue
+            log_m, log_t = np.log([m for m, _ in points]), np.log([t for _, t in points])
+            b, a = np.polyfit(log_m, log_t, 1)
+            residual = log_t - (a + b * log_m)
+            total = ((log_t - log_t.mean()) ** 2).sum()
+            r2 = 1 - (residual ** 2).sum() / total if total > 0 else 1.0
+            fits[formulation] = (float(np.exp(a)), float(b), float(r2), len(points))
+        return fits
+
+
+def plot_performance_profile(report: Report, path: Path):
+    ratios, fraction = report.performance_profile()
+    fig, ax = plt.subplots(figsize=(7, 4.5))
+    finite = ratios[np.isfinite(ratios)]
+    tau_max = max(2.0, finite.max() * 1.5) if len(finite) else 2.0
+    for column, formulation in enumerate(report.formulations):
+        # the ratios are sorted, so the finite ones come first; the last fraction is carried to the right end
+        finite_rows = np.isfinite(ratios[:, column])
+        x = np.concatenate(([1.0], ratios[finite_rows, column], [tau_max]))
+        y = np.concatenate(([0.0], fraction[finite_rows]))
+        ax.step(x, np.append(y, y[-1]), where="post", label=formulation)
+    ax.set_xscale("log", base=2)
+    ax.set_xlim(1, tau_max)
+    ax.set_ylim(0, 1.02)
+    ax.set_xlabel("τ (runtime ratio to the fastest formulation)")
+    ax.set_ylabel("fraction of problems solved within τ")
+    ax.set_title("Performance profile")
+    ax.grid(True, which="both", alpha=0.3)
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(path, dpi=150)
+    plt.close(fig)
+
+
+def plot_scaling(report: Report, sizes: dict, fits: dict, path: Path):
+    if not sizes:
+        return
+    fig, ax = plt.subplots(figsize=(7, 4.5))
+    for formulation in report.formulations:
+        runs = [run for run in report.results if run["formulation"] == formulation and run["instance"] in sizes]
+        solved = [run for run in runs if is_solved(run)]
+        line = ax.scatter([sizes[run["instance"]][1] for run in solved], [runtime(run) for run in solved],
+                          s=14, label=formulation)
+        unsolved = [run for run in runs if not is_solved(run)]
+        if unsolved:
+            ax.scatter([sizes[run["instance"]][1] for run in unsolved], [report.timelimit] * len(unsolved),
+                       s=20, marker="x", color=line.get_facecolor()[0])
+        if formulation in fits:
+            c, b, _, _ = fits[formulation]
+            m = np.geomspace(min(size[1] for size in sizes.values()), max(size[1] for size in sizes.values()), 50)
+            ax.plot(m, c * m ** b, color=line.get_facecolor()[0], linewidth=1)
+    ax.axhline(report.timelimit, color="gray", linestyle=":", linewidth=1)
+    ax.set_xscale("log")
+    ax.set_yscale("log")
+    ax.set_xlabel("|E|")
+    ax.set_ylabel("runtime [s] (x: not solved)")
+    ax.set_title("Runtime scaling with fits runtime = c·|E|^b")
+    ax.grid(True, which="both", alpha=0.3)
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(path, dpi=150)
+    plt.close(fig)
+
+
+def plot_breakdown(report: Report, path: Path):
+    """Branch-and-bound nodes and lazy constraints per problem and formulation."""
+    labels = [f"{Path(instance).stem} k={k}" for instance, k in report.problems]
+    x = np.arange(len(report.problems))
+    width = 0.8 / max(len(report.formulations), 1)
+    fig, axes = plt.subplots(2, 1, figsize=(max(7, 0.5 * len(labels) + 2), 7), sharex=True)
+    for ax, field, title in zip(axes, ("n_nodes", "n_lazy_constraints"), ("B&B nodes", "lazy constraints")):
+        for column, formulation in enumerate(report.formulations):
+            values = [(report.run(p, formulation) or {}).get(field) or 0 for p in report.problems]
+            ax.bar(x + (column - (len(report.formulations) - 1) / 2) * width, np.asarray(values) + 1, width,
+                   label=formulation)
+        ax.set_yscale("log")
+        ax.set_ylabel(f"{title} + 1")
+        ax.grid(True, axis="y", alpha=0.3)
+    axes[0].legend(ncols=min(len(report.formulations), 6))
+    axes[1].set_xticks(x, labels, rotation=60, ha="right", fontsize=7)
+    fig.tight_layout()
+    fig.savefig(path, dpi=150)
+    plt.close(fig)
+
+
+def format_number(value, digits: int = 2) -> str:
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "-"
+    return f"{value:.{digits}f}" if isinstance(value, float) else str(value)
+
+
+def markdown_table(headers: list[str], rows: list[list]) -> str:
+    lines = ["| " + " | ".join(headers) + " |", "|" + "---|" * len(headers)]
+    lines += ["| " + " | ".join(format_number(value) for value in row) + " |" for row in rows]
+    return "\n".join(lines)
+
+
+def write_report(report: Report, sizes: dict, output_dir: Path) -> Path:
+    output_dir.mkdir(parents=True, exist_ok=True)
+    fits = report.scaling_fits(sizes)
+    plot_performance_profile(report, output_dir / "performance_profile.png")
+    plot_scaling(report, sizes, fits, output_dir / "scaling.png")
+    plot_breakdown(report, output_dir / "breakdown.png")
+
+    summary = report.summary()
+    sections = [
+        "# Benchmark report",
+        f"{len(report.problems)} problems (instance, k), {len(report.results)} runs, time limit {report.timelimit:g}s. "
+        f"Unsolved runs count with the time limit.",
+        "## Summary",
+        markdown_table(["formulation", "runs", "solved", "time-outs", f"sgm time [s] (shift {TIME_SHIFT:g})",
+                        f"sgm nodes (shift {NODE_SHIFT:g})", "mean lazy cuts", "mean gap (unsolved)"],
+                       [[row["formulation"], row["runs"], row["solved"], row["timeouts"], row["sgm_time"],
+                         row["sgm_nodes"], row["mean_lazy"], row["mean_gap_unsolved"]] for row in summary]),
+        "## Performance profile",
+        "![performance profile](performance_profile.png)",
+        "## Scaling",
+        markdown_table(["formulation", "c", "b (exponent of the edge count)", "R²", "solved runs"],
+                       [[f, f"{c:.3g}", b, r2, n] for f, (c, b, r2, n) in fits.items()]),
+        "![scaling](scaling.png)" if sizes else "No instance files found for the scaling plot.",
+        "## Nodes and lazy constraints",
+        markdown_table(["instance", "k", "edges"] + [f"{f} nodes / lazy" for f in report.formulations],
+                       [[Path(instance).stem, k, sizes.get(instance, (None, None))[1]] +
+                        [breakdown_cell(report.run((instance, k), f)) for f in report.formulations]
+                        for instance, k in report.problems]),
+        "![nodes and lazy constraints](breakdown.png)",
+    ]
+    path = output_dir / "report.md"
+    path.write_text("\n\n".join(sections) + "\n", encoding="utf-8")
+    return path
+
+
+def breakdown_cell(run: dict | None) -> str:
+    if run is None:
+        return "-"
+    cell = f"{run.get('n_nodes') or 0} / {run.get('n_lazy_constraints') or 0}"
+    return cell if is_solved(run) else cell + " (unsolved)"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Performance profiles, scaling fits and breakdowns of benchmark results")
+    parser.add_argument("--results", type=str, default=RESULTS_DEFAULT,
+                        help=f"result store (.jsonl) or CSV file written by benchmarking.py (default: {RESULTS_DEFAULT})")
+    parser.add_argument("--data-dir", type=str, default=DATA_DIR_DEFAULT,
+                        help="directory of the instances, for their sizes in the scaling fits")
+    parser.add_argument("--output-dir", type=str, default=OUTPUT_DIR_DEFAULT, help="directory for report.md and the plots")
+    parser.add_argument("--timelimit", type=float, default=TIMELIMIT, help="time limit of the benchmark runs in seconds")
+    parser.add_argument("--formulations", nargs="+", help="only report these formulations")
+    args = parser.parse_args()
+
+    results = load_results(args.results)
+    if args.formulations:
+        results = [result for result in results if result["formulation"] in args.formulations]
+    if not results:
+        print(f"No results in {args.results}")
+        return
+
+    report = Report(results, args.timelimit)
+    path = write_report(report, instance_sizes(results, Path(args.data_dir)), Path(args.output_dir))
+    print(f"Wrote report on {len(results)} runs to {path}")
+
+
+if __name__ == "__main__":
+    main()
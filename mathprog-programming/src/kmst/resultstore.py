@@ -0,0 +1,99 @@
+import csv
+import json
+import os
+import time
+from pathlib import Path
+
+from profiling import PROFILE_HEADERS
+
+HEADERS = [
+    "instance",             # Instance name stem (e.g., g01)
+    "k",                    # Value of k used
+    "formulation",          # Formulation identifier (seq, scf, etc.)
+    "status",               # Gurobi status code
+    "objective_value",      # Best objective value found
+    "best_bound",           # Best objective bound (for MIPs)
+    "lagrangian_bound",     # Lagrangian bound computed before the solve
+    "gap",                  # MIPGap reported by Gurobi
+    "runtime",              # Runtime reported by Gurobi
+    "wall_time",            # Runtime plus reading and preprocessing the instance
+    "n_nodes",              # Branch-and-bound nodes explored
+    "n_lazy_constraints" ,   # Number of added constraints (for CEC/DCC/lazy MCF, we should count this in kmst.py)
+    "n_user_cuts",          # GSEC/DCC user cuts of the cut loop (--cut-rounds)
+    "n_pool_hits",          # Callbacks answered with violated cuts from the cut pool
+    "n_pool_misses",        # Callbacks that had to run the separator
+    "n_pool_duplicates",    # Separated cuts that were already pooled
+    "n_removed_nodes",      # Nodes removed by the graph reduction
+    "n_removed_edges",      # Edges removed by the graph reduction
+    "is_valid_k_mst",
+    *PROFILE_HEADERS        # Phase times (time_*) and separator statistics (sep_*), see profiling.py
+]
+
+
+def result_key(result: dict) -> tuple:
+    return result["instance"], int(result["k"]), result["formulation"]
+
+
+class ResultStore:
+    """Append-only JSONL file with one benchmark result per line.
+
+    Every result is flushed and fsync'ed right after it is written, so an interrupted
+    sweep loses at most the runs that were in progress. A line that was cut off by a
+    crash is ignored when the store is read.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+
+    def read(self) -> list[dict]:
+        if not self.path.exists():
+            return []
+        results = []
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    results.append(json.loads(line))
+                except json.JSONDecodeError:
+                    print(f"  Warning: ignoring incomplete line in {self.path}")
+        return results
+
+    def completed(self) -> set[tuple]:
+        """(instance, k, formulation) of all stored results."""
+        return {result_key(result) for result in self.read()}
+
+    def is_empty(self) -> bool:
+        return not self.path.exists() or self.path.stat().st_size == 0
+
+    def rotate(self) -> Path | None:
+        """Moves the stored results aside to <stem>.<timestamp><suffix>, returns the new path (None if there were none)."""
+        if self.is_empty():
+            return None
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        rotated = self.path.with_name(f"{self.path.stem}.{stamp}{self.path.suffix}")
+        n = 1
+        while rotated.exists():
+            rotated = self.path.with_name(f"{self.path.stem}.{stamp}-{n}{self.path.suffix}")
+            n += 1
+        self.path.rename(rotated)
+        return rotated
+
+    def append(self, result: dict):
+        # start a new line if the last write was cut off
+        with open(self.path, "ab") as f:
+            if f.tell() > 0:
+                with open(self.path, "rb") as last:
+                    last.seek(-1, os.SEEK_END)
+                    if last.read(1) != b"\n":
+                        f.write(b"\n")
+            f.write((json.dumps(result) + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def export_csv(self, output_csv_path: str | Path) -> int:
+        """Writes the stored results to a CSV file (the latest result per run wins), returns the number of rows."""
+        results = {result_key(result): result for result in self.read()}
+        with open(output_csv_path, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=HEADERS, extrasaction='ignore')# extrasaction='ignore' prevents errors if the JSON has extra unexpected fields
+            writer.writeheader() # Write the header row
+            writer.writerows(results.values())
+        return len(results)
@@ -0,0 +1,145 @@
+import argparse
+import contextlib
+import json
+import os
+import signal
+import socketserver
+import sys
+
+import gurobipy as gp
+
+from graph import Graph
+from kmst import FORMULATIONS, build_parser, solve, solve_sweep
+from profiling import Profile
+
+# options a job may set in addition to instance, k and formulation (see kmst.build_parser)
+JOB_OPTIONS = {"threads", "timelimit", "memorylimit", "heuristic_roots", "reduction", "lagrangian", "solution_file",
+               "cut_rounds", "cut_nodes", "cut_violation", "race_formulations", "decompose", "workers"}
+
+
+def parse_option(action: argparse.Action, value):
+    """The value of a job option as its command line option would parse it, raises ValueError if it is invalid."""
+    option = action.option_strings[0]
+    # flags (--decompose, --reduction/--no-reduction) only take JSON booleans
+    if action.nargs == 0:
+        if not isinstance(value, bool):
+            raise ValueError(f"{option} must be true or false, got {value!r}")
+        return value
+    if value is None and action.default is None:
+        return None
+
+    is_list = action.nargs in ("+", "*")
+    values = value if is_list and isinstance(value, list) else [value]
+    parsed = []
+    for item in values:
+        # the JSON values are parsed from their text, so e.g. 4.5 is not accepted as an int and true not as a number
+        if isinstance(item, (bool, list, dict)) or item is None:
+            raise ValueError(f"invalid {option} {value!r}")
+        try:
+            item = action.type(str(item)) if action.type is not None else str(item)
+        except (ValueError, argparse.ArgumentTypeError):
+            raise ValueError(f"invalid {option} {value!r}")
+        if action.choices is not None and item not in action.choices:
+            raise ValueError(f"{option} must be one of {list(action.choices)}, got {item!r}")
+        parsed.append(item)
+    return parsed if is_list else parsed[0]
+
+
+class Server:
+    """Solves k-MST jobs with one Gurobi environment and a cache of the parsed instances.
+
+    A job is a JSON object with instance, k and formulation, optionally the options in
+    JOB_OPTIONS and an id. The options are checked and converted like their command line
+    options (see parse_option). The reply is the results dict of kmst.py with the id
+    added, or {"id": ..., "error": ...} if the job failed. A job with several k (a list or a
+    string as accepted by --k) is solved as a sweep with one reply per k. Solver and
+    Gurobi output go to stderr, so stdout only carries replies.
+    """
+
+    def __init__(self):
+        self.env = gp.Env(empty=True)
+        self.env.setParam("LogToConsole", 0)
+        self.env.start()
+        self.instances: dict[str, tuple[float, Graph]] = {}
+
+    def graph(self, filename: str) -> Graph:
+        # reload instances that changed on disk
+        mtime = os.stat(filename).st_mtime
+        cached = self.instances.get(filename)
+        if cached is None or cached[0] != mtime:
+            cached = self.instances[filename] = (mtime, Graph.read(filename))
+        return cached[1]
+
+    def handle(self, line: str) -> list[dict]:
+        job_id = None
+        try:
+            job = json.loads(line)
+            job_id = job.pop("id", None)
+            unknown = set(job) - JOB_OPTIONS - {"instance", "k", "formulation"}
+            if unknown:
+                raise ValueError(f"unknown job options {sorted(unknown)}")
+            if job.get("formulation") not in FORMULATIONS + ["race"]:
+                raise ValueError(f"formulation must be one of {FORMULATIONS + ['race']}")
+
+            k = job.pop("k")
+            k = ",".join(map(str, k)) if isinstance(k, list) else str(k)
+            parser = build_parser()
+            args = parser.parse_args(["--instance", str(job.pop("instance")), "--k", k,
+                                      "--formulation", str(job.pop("formulation"))])
+            actions = {action.dest: action for action in parser._actions}
+            for option, value in job.items():
+                setattr(args, option, parse_option(actions[option], value))
+            if args.decompose and args.formulation == "race":
+                raise ValueError("decompose cannot be combined with the race formulation")
+
+            with contextlib.redirect_stdout(sys.stderr):
+                profile = Profile()
+                with profile.phase("read"):
+                    G = self.graph(args.instance)
+                if isinstance(args.k, list):
+                    results = solve_sweep(G, args, args.k, self.env, profile)
+                else:
+                    results = [solve(G, args, self.env, profile)]
+            return [{"id": job_id, **result} for result in results]
+        except (Exception, SystemExit) as e:
+            return [{"id": job_id, "error": repr(e)}]
+
+    def serve_stream(self, lines, write):
+        for line in lines:
+            if line.strip():
+                for reply in self.handle(line):
+                    write(json.dumps(reply) + "\n")
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog="kmst.py serve", description="k-MST solver daemon reading JSONL jobs")
+    parser.add_argument("--socket", type=str, help="listen on this Unix socket instead of stdin/stdout")
+    args = parser.parse_args(argv)
+
+    server = Server()
+    if args.socket is None:
+        def write(reply):
+            sys.stdout.write(reply)
+            sys.stdout.flush()
+        server.serve_stream(sys.stdin, write)
+        return
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            def write(reply):
+                self.wfile.write(reply.encode("utf-8"))
+                self.wfile.flush()
+            server.serve_stream((line.decode("utf-8") for line in self.rfile), write)
+
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+    # leave through the finally clause below on SIGTERM as well
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    # connections are served one after another, they share the environment and the instances
+    with socketserver.UnixStreamServer(args.socket, Handler) as unix_server:
+        try:
+            unix_server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(args.socket)
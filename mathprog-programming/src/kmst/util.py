@@ -1,20 +1,127 @@
-import random
+import hashlib
+import os
+from pathlib import Path
+
+import gurobipy as gp
 import networkx as nx
+import numpy as np
 
-def read_instance(filename: str) -> nx.Graph:
-    with open(filename, "r", encoding="utf-8") as f:
-        n_nodes = int(f.readline())
-        n_edges = int(f.readline())
+from generator import generate
+
+class DisjointSet:
+    """Union-find over the elements 0..n-1 with path halving and union by size."""
+
+    __slots__ = ("parent", "size")
+
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+        self.size = [1] * n
+
+    def find(self, i: int) -> int:
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, i: int, j: int) -> bool:
+        """Merge the sets of i and j, returns False if they already were the same set."""
+        i, j = self.find(i), self.find(j)
+        if i == j:
+            return False
+        if self.size[i] < self.size[j]:
+            i, j = j, i
+        self.parent[j] = i
+        self.size[i] += self.size[j]
+        return True
+
+
+# state of a worker process of the solver process pools, set by init_worker
+_worker_env = None
+_worker_state = ()
+
+
+def init_worker(*state):
+    """Initializer of a solver process pool: starts a silent Gurobi environment for the worker and keeps the initargs.
+
+    The worker's tasks get them with worker_env() and worker_state(), so the environment is
+    started and the shared state is sent once per process instead of once per task.
+    """
+    global _worker_env, _worker_state
+    _worker_env = gp.Env(empty=True)
+    _worker_env.setParam("OutputFlag", 0)
+    _worker_env.start()
+    _worker_state = state
+
+
+def worker_env() -> gp.Env:
+    return _worker_env
 
-        G = nx.Graph()
-        G.add_nodes_from(range(1, n_nodes+1))
 
-        for line in f:
-            values = [int(i) for i in line.split()]
-            if len(values) == 4:
-                G.add_edge(values[1], values[2], id=values[0], cost=values[3])
+def worker_state() -> tuple:
+    return _worker_state
 
-        return G
+
+def parse_instance(filename: str) -> tuple[int, np.ndarray]:
+    """Number of nodes and the (id, u, v, cost) rows of the edges of an instance file."""
+    with open(filename, "r", encoding="utf-8") as f:
+        text = f.read()
+
+    tokens = text.split()
+    n_nodes = int(tokens[0])
+    if (len(tokens) - 2) % 4 == 0:
+        edges = np.array(tokens[2:], dtype=np.int64).reshape(-1, 4)
+    else:
+        # not all lines have four values, keep only the edge lines
+        rows = [line.split() for line in text.splitlines()[2:]]
+        edges = np.array([row for row in rows if len(row) == 4], dtype=np.int64).reshape(-1, 4)
+    return n_nodes, edges
+
+def read_instance_arrays(filename: str, cache: bool = True) -> tuple[int, np.ndarray]:
+    """Like parse_instance, but cached in a memory-mapped .npy sidecar keyed by the file hash.
+
+    The first row of the cached array holds the number of nodes. Sidecars of earlier
+    versions of the file are replaced; if the directory is not writable, the file is
+    parsed without caching. Concurrent processes can read the same instance: the sidecar
+    is written atomically and only sidecars of other versions are removed.
+    """
+    if not cache:
+        return parse_instance(filename)
+
+    path = Path(filename)
+    digest = hashlib.blake2b(path.read_bytes(), digest_size=8).hexdigest()
+    sidecar = path.with_name(f"{path.name}.{digest}.npy")
+    # a sidecar that cannot be loaded (e.g. removed by another process meanwhile) is a cache miss
+    try:
+        data = np.load(sidecar, mmap_mode="r")
+        return int(data[0, 0]), data[1:]
+    except (OSError, ValueError):
+        pass
+
+    n_nodes, edges = parse_instance(filename)
+    data = np.vstack(([n_nodes, len(edges), 0, 0], edges))
+    try:
+        # the current sidecar may just have been written by another process, which may be mapping it
+        for stale in path.parent.glob(f"{path.name}.*.npy"):
+            if stale != sidecar:
+                stale.unlink(missing_ok=True)
+        temp = sidecar.with_name(f"{sidecar.name}.{os.getpid()}.tmp")
+        with open(temp, "wb") as f:
+            np.save(f, data)
+        os.replace(temp, sidecar)
+    except OSError:
+        pass
+    return n_nodes, edges
+
+def read_instance(filename: str, cache: bool = True) -> nx.Graph:
+    n_nodes, edges = read_instance_arrays(filename, cache)
+
+    G = nx.Graph()
+    G.add_nodes_from(range(1, n_nodes+1))
+    ids, u, v, cost = np.asarray(edges).T.tolist()
+    G.add_edges_from((i, j, {"id": e, "cost": c}) for e, i, j, c in zip(ids, u, v, cost))
+
+    return G
     
 def write_instance(filename: str, graph: nx.Graph):
     with open(filename, mode="w", encoding="utf-8") as f:
@@ -31,52 +138,10 @@ def write_solution(filename: str, edge_ids: list[int]):
 
 
 def create_random_instance(n_nodes: int, n_edges: int, random_seed: int = 42) -> nx.Graph:
-    assert n_edges <= n_nodes * (n_nodes - 1) / 2
-    rnd = random.Random(random_seed)
-
-    nodes = range(1, n_nodes+1)
-    connected_nodes = list(nodes)[:1]
-    unconnected_nodes = list(nodes)[1:]
-    rnd.shuffle(unconnected_nodes)
-
-    edges = set()
-    # first n-1 edges: build a tree
-    # connect unconnected node to connected node
-    while unconnected_nodes:
-        i = rnd.choice(connected_nodes)
-        j = unconnected_nodes.pop()
-
-        assert j not in connected_nodes
-        connected_nodes.append(j)
-
-        i, j = sorted((i, j))
-        assert (i,j) not in edges
-
-        edges.add((i, j))
-
-    assert list(sorted(connected_nodes)) == list(nodes)
-    assert len(edges) == n_nodes-1
-
-    # remaining edges: connect two random nodes
-    while len(edges) < n_edges:
-        i, j = rnd.sample(connected_nodes, 2)
-        i, j = sorted((i, j))
-        assert i != j
-        
-        if (i,j) in edges:
-            continue
-        
-        edges.add((i, j))
-
-    assert len(edges) == n_edges
-
+    """Random connected instance as nx.Graph, see generator.generate for larger instances and other families."""
+    tail, head, cost = generate("random", n_nodes, n_edges, random_seed)
     graph = nx.Graph()
-    graph.add_nodes_from(nodes)
-    for id, (i, j) in enumerate(sorted(edges)):
-        cost = rnd.randrange(1, 1000)
-        graph.add_edge(i, j, id=id, cost=cost)
-
-    assert graph.number_of_nodes() == n_nodes
-    assert graph.number_of_edges() == n_edges
-
+    graph.add_nodes_from(range(1, n_nodes + 1))
+    graph.add_edges_from((i, j, {"id": e, "cost": c}) for e, (i, j, c) in enumerate(zip(
+        (tail + 1).tolist(), (head + 1).tolist(), cost.tolist())))
     return graph
@@ -1,8 +1,12 @@
 from pyvis.network import Network
 
+from graph import Graph
 from model import get_selected_edge_ids
 
 def plot_graph(model, G):
+    if isinstance(G, Graph):
+        G = G.to_networkx()
+
     # Build MST subgraph
     selected_edges = set(get_selected_edge_ids(model))
     selected_edge_tuples = [e for e in G.edges if G.edges[e]["id"] in selected_edges]